@@ -0,0 +1,319 @@
+import hashlib
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from boolean import stream_dimacs
+from reader import Island, read_puzzle_from_string
+
+# The cnf is written in the binary format to paths with this suffix, as DIMACS to every other path
+ARTIFACT_SUFFIX = ".hcnf"
+
+MAGIC = b"HASHICNF"
+VERSION = 1
+# magic, version, height, width, variables, clauses, literals, islands, bridges, fixed bridges,
+# sha-256 of the puzzle
+_HEADER = struct.Struct("<8sIIIIQQIII32s")
+# the integers of every array, little endian
+_INT32 = np.dtype("<i4")
+
+
+def puzzle_hash(puzzle: str) -> bytes:
+    """
+    sha-256 of the puzzle, trailing whitespace and empty lines do not change it
+    """
+    text = "\n".join(line.rstrip() for line in puzzle.strip().splitlines())
+    return hashlib.sha256(text.encode()).digest()
+
+
+class CnfArtifact:
+    """
+    A cnf read back from a file, with everything needed to solve it and decode the solution
+    without encoding the puzzle again. The clauses are kept as two arrays: the literals of all clauses
+    one after another, and the offsets, clause i is literals[offsets[i]:offsets[i + 1]].
+
+    The binary format (ARTIFACT_SUFFIX) is the header (_HEADER), followed by int32 arrays:
+    the literals, the offsets (one more than clauses), the islands as (row, column, number),
+    the bridges as (variable, island, island) and the fixed bridges as (island, island, count),
+    islands by their index in the islands. The arrays of a binary file are mapped into memory, not read.
+    A DIMACS file carries the same information in comments after the clauses:
+    "c puzzle height width hash", "c island row column number",
+    "c bridge variable row column row column" and "c fixed row column row column count".
+    DIMACS files without these comments can be read as well, they are only missing the mapping.
+    """
+
+    height: int
+    width: int
+    number_of_variables: int
+    literals: np.ndarray
+    offsets: np.ndarray
+    islands: List[Island]
+    # the variable of each bridge, between the islands above
+    variables: Dict[int, Tuple[Island, Island]]
+    # bridges fixed by the deduction before encoding
+    fixed: List[Tuple[Island, Island, int]]
+    # sha-256 of the puzzle the cnf was written for, None if unknown
+    hash: bytes | None
+
+    def __init__(self, height, width, number_of_variables, literals, offsets, hash=None):
+        self.height = height
+        self.width = width
+        self.number_of_variables = number_of_variables
+        self.literals = literals
+        self.offsets = offsets
+        self.islands = []
+        self.variables = {}
+        self.fixed = []
+        self.hash = hash
+
+    @property
+    def number_of_clauses(self) -> int:
+        return len(self.offsets) - 1
+
+    def clauses(self) -> Iterator[List[int]]:
+        """
+        The clauses as lists, sliced from the literals. The solvers of pysat only take python integers,
+        so the literals are converted once and every clause is a slice of them.
+        """
+        literals, offsets = self.literals.tolist(), self.offsets.tolist()
+        return (literals[start:end] for start, end in zip(offsets, offsets[1:]))
+
+    def matches(self, puzzle: str) -> bool:
+        """
+        Whether the cnf was written for the puzzle, True if that is unknown
+        """
+        return self.hash is None or self.hash == puzzle_hash(puzzle)
+
+    def puzzle(self) -> str | None:
+        """
+        The puzzle rebuilt from the islands, None if the file does not have them
+        """
+        if not self.islands:
+            return None
+        rows = [bytearray(b"." * self.width) for _ in range(self.height)]
+        for island in self.islands:
+            rows[island.x][island.y] = ord(str(island.number_of_bridges))
+        return "\n".join([f"{self.height} {self.width}"] + [row.decode() for row in rows]) + "\n"
+
+    def _add_islands(self, islands: Iterable[Tuple[int, int, int]]):
+        self.islands = [
+            Island(row, column, number, str(i + 1))
+            for i, (row, column, number) in enumerate(islands)
+        ]
+
+
+def _island_indices(puzzle: str) -> Tuple[List[Island], Dict[Tuple[int, int], int], int, int]:
+    """
+    The islands of the puzzle, the index of the island at each position and the size of the puzzle
+    """
+    islands, _ = read_puzzle_from_string(puzzle)
+    height, width = map(int, puzzle.split(None, 2)[:2])
+    return islands, {(island.x, island.y): i for i, island in enumerate(islands)}, height, width
+
+
+def stream_artifact(
+    clauses: Iterable[List[int]],
+    file,
+    puzzle: str | None = None,
+    variables: Dict[int, Tuple[Island, Island]] | None = None,
+    fixed: List[Tuple[Island, Island, int]] = (),
+    chunk_size: int = 1 << 16,
+) -> Iterator[List[int]]:
+    """
+    Passes the clauses through while writing them in the binary format to the binary file,
+    like stream_dimacs. The bridges are matched to the islands of the puzzle by their position,
+    so they can be residual copies of the deduction. The variables are only read when the clauses
+    are exhausted, the ast encodings number them while the clauses are yielded.
+    """
+    header_position = file.tell()
+    file.write(b"\0" * _HEADER.size)
+    number_of_variables = 0
+    offsets = [0]
+    chunk = []
+    for clause in clauses:
+        chunk.extend(clause)
+        offsets.append(offsets[-1] + len(clause))
+        if len(chunk) >= chunk_size:
+            literals = np.array(chunk, dtype=_INT32)
+            number_of_variables = max(number_of_variables, int(np.abs(literals).max()))
+            file.write(literals.tobytes())
+            chunk.clear()
+        yield clause
+    if chunk:
+        literals = np.array(chunk, dtype=_INT32)
+        number_of_variables = max(number_of_variables, int(np.abs(literals).max()))
+        file.write(literals.tobytes())
+    file.write(np.array(offsets, dtype=_INT32).tobytes())
+
+    height = width = 0
+    islands, bridges, fixed_bridges = [], [], []
+    digest = b"\0" * 32
+    if puzzle is not None:
+        islands, index, height, width = _island_indices(puzzle)
+        digest = puzzle_hash(puzzle)
+        bridges = [
+            (variable, index[(x.x, x.y)], index[(y.x, y.y)])
+            for variable, (x, y) in (variables or {}).items()
+        ]
+        fixed_bridges = [(index[(x.x, x.y)], index[(y.x, y.y)], count) for x, y, count in fixed]
+    for rows in (
+        [(island.x, island.y, island.number_of_bridges) for island in islands],
+        bridges,
+        fixed_bridges,
+    ):
+        file.write(np.array(rows, dtype=_INT32).reshape(-1, 3).tobytes())
+    end = file.tell()
+    file.seek(header_position)
+    file.write(
+        _HEADER.pack(
+            MAGIC,
+            VERSION,
+            height,
+            width,
+            number_of_variables,
+            len(offsets) - 1,
+            offsets[-1],
+            len(islands),
+            len(bridges),
+            len(fixed_bridges),
+            digest,
+        )
+    )
+    file.seek(end)
+
+
+def _dimacs_mapping(
+    file,
+    puzzle: str,
+    variables: Dict[int, Tuple[Island, Island]],
+    fixed: List[Tuple[Island, Island, int]],
+):
+    islands, _, height, width = _island_indices(puzzle)
+    lines = [f"c puzzle {height} {width} {puzzle_hash(puzzle).hex()}\n"]
+    lines.extend(f"c island {i.x} {i.y} {i.number_of_bridges}\n" for i in islands)
+    lines.extend(f"c bridge {v} {x.x} {x.y} {y.x} {y.y}\n" for v, (x, y) in variables.items())
+    lines.extend(f"c fixed {x.x} {x.y} {y.x} {y.y} {count}\n" for x, y, count in fixed)
+    file.write("".join(lines))
+
+
+def stream_cnf(
+    clauses: Iterable[List[int]],
+    path: Path,
+    puzzle: str | None = None,
+    variables: Dict[int, Tuple[Island, Island]] | None = None,
+    fixed: List[Tuple[Island, Island, int]] = (),
+) -> Iterator[List[int]]:
+    """
+    Passes the clauses through while writing them to path, in the binary format if it ends with
+    ARTIFACT_SUFFIX, otherwise as DIMACS with the mapping of the bridges in comments after the clauses.
+    Either can be solved again with load_cnf, without the puzzle.
+    """
+    if Path(path).suffix == ARTIFACT_SUFFIX:
+        with open(path, "wb") as file:
+            yield from stream_artifact(clauses, file, puzzle, variables, fixed)
+        return
+    with open(path, "w") as file:
+        yield from stream_dimacs(clauses, file)
+        if puzzle is not None:
+            _dimacs_mapping(file, puzzle, variables or {}, fixed)
+
+
+def _load_artifact(path: Path) -> CnfArtifact:
+    with open(path, "rb") as file:
+        # the map stays open as long as the arrays refer to it
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (
+        magic,
+        version,
+        height,
+        width,
+        number_of_variables,
+        number_of_clauses,
+        number_of_literals,
+        number_of_islands,
+        number_of_bridges,
+        number_of_fixed,
+        digest,
+    ) = _HEADER.unpack_from(buffer)
+    if version != VERSION:
+        raise ValueError(f"{path} has version {version} of the cnf format, expected {VERSION}")
+    position = _HEADER.size
+    arrays = []
+    for count in (
+        number_of_literals,
+        number_of_clauses + 1,
+        3 * number_of_islands,
+        3 * number_of_bridges,
+        3 * number_of_fixed,
+    ):
+        arrays.append(np.frombuffer(buffer, dtype=_INT32, count=count, offset=position))
+        position += count * _INT32.itemsize
+    literals, offsets, islands, bridges, fixed = arrays
+    artifact = CnfArtifact(
+        height,
+        width,
+        number_of_variables,
+        literals,
+        offsets,
+        digest if number_of_islands else None,
+    )
+    artifact._add_islands(islands.reshape(-1, 3).tolist())
+    nodes = artifact.islands
+    artifact.variables = {
+        variable: (nodes[x], nodes[y]) for variable, x, y in bridges.reshape(-1, 3).tolist()
+    }
+    artifact.fixed = [(nodes[x], nodes[y], count) for x, y, count in fixed.reshape(-1, 3).tolist()]
+    return artifact
+
+
+def _load_dimacs(path: Path) -> CnfArtifact:
+    height = width = number_of_variables = 0
+    digest = None
+    islands, bridges, fixed, body = [], [], [], []
+    with open(path) as file:
+        for line in file:
+            if line.startswith("c "):
+                kind, *values = line[2:].split()
+                if kind == "puzzle":
+                    height, width, digest = int(values[0]), int(values[1]), bytes.fromhex(values[2])
+                elif kind == "island":
+                    islands.append(tuple(map(int, values)))
+                elif kind == "bridge":
+                    bridges.append(tuple(map(int, values)))
+                elif kind == "fixed":
+                    fixed.append(tuple(map(int, values)))
+            elif line.startswith("p "):
+                number_of_variables = int(line.split()[2])
+            elif not line.startswith(("c", "%")):
+                body.append(line)
+    # every clause ends with 0, clause i ends at the i-th 0 with i zeros before it
+    numbers = np.array(" ".join(body).split(), dtype=_INT32)
+    ends = np.flatnonzero(numbers == 0)
+    offsets = np.zeros(len(ends) + 1, dtype=_INT32)
+    offsets[1:] = ends - np.arange(len(ends))
+    artifact = CnfArtifact(
+        height, width, number_of_variables, numbers[numbers != 0], offsets, digest
+    )
+    artifact._add_islands(islands)
+    positions = {(island.x, island.y): island for island in artifact.islands}
+    artifact.variables = {
+        variable: (positions[(r1, c1)], positions[(r2, c2)])
+        for variable, r1, c1, r2, c2 in bridges
+    }
+    artifact.fixed = [
+        (positions[(r1, c1)], positions[(r2, c2)], count) for r1, c1, r2, c2, count in fixed
+    ]
+    return artifact
+
+
+def load_cnf(path: Path) -> CnfArtifact:
+    """
+    Reads a cnf written by stream_cnf, or any DIMACS file. The binary format is recognised by its magic,
+    not by the suffix.
+    """
+    with open(path, "rb") as file:
+        binary = file.read(len(MAGIC)) == MAGIC
+    return _load_artifact(path) if binary else _load_dimacs(path)
@@ -0,0 +1,317 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection, wait
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from cache import SolutionCache
+from formats import FORMATS, format_solution
+from main import add_solve_arguments, make_cache, solution_to_list, solve, solve_options
+
+# The first line of a puzzle, "rows columns"
+_HEADER = re.compile(r"\s*\d+\s+\d+\s*$")
+
+
+def read_puzzle_stream(stream: TextIO) -> Iterator[str]:
+    """
+    Splits a stream of puzzles written one after another. The header of each puzzle
+    tells how many lines belong to it, blank lines between the puzzles are skipped.
+    If a puzzle file without a newline at its end is followed by the next one, the header of the next
+    puzzle is glued to the last row, it is split off again if the row is longer than the puzzle is wide.
+    A line where a header is expected but that is not "rows columns" is passed on with the lines
+    up to the next header, solving it fails with an error record and the puzzles after it are still solved.
+    """
+    lines = iter(stream)
+    header = next(lines, None)
+    while header is not None:
+        if not header.strip():
+            header = next(lines, None)
+            continue
+        body = []
+        following = None
+        if _HEADER.match(header):
+            rows, width = map(int, header.split())
+            for line in lines:
+                if len(body) == rows - 1 and _HEADER.match(line[width:]):
+                    body.append(line[:width] + "\n")
+                    following = line[width:]
+                    break
+                body.append(line)
+                if len(body) == rows:
+                    break
+            if following is None:
+                following = next(lines, None)
+        else:
+            for line in lines:
+                if _HEADER.match(line):
+                    following = line
+                    break
+                body.append(line)
+        yield header + "".join(body)
+        header = following
+
+
+def find_puzzles(source: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (name, puzzle) for every puzzle of a directory (all .txt files), a glob,
+    or "-" for puzzles streamed through stdin
+    """
+    if source == "-":
+        for index, puzzle in enumerate(read_puzzle_stream(sys.stdin)):
+            yield f"stdin:{index}", puzzle
+        return
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*.txt")))
+    else:
+        paths = sorted(glob.glob(source))
+    for path in paths:
+        with open(path) as file:
+            yield path, file.read()
+
+
+def solve_record(
+    name: str,
+    puzzle: str,
+    options: Dict,
+    cache: SolutionCache | None = None,
+    output_format: str = "json",
+) -> Dict:
+    """
+    Solves one puzzle and returns the result as json serializable dict,
+    with the solution in output_format (see formats.FORMATS)
+    """
+    timings = {}
+    start = time.perf_counter()
+    try:
+        # the cache parses the puzzle as well, a malformed puzzle fails here already
+        if cache is not None and options.get("connected", True):
+            found, solution = cache.get(puzzle)
+            if found:
+                return {
+                    "puzzle": name,
+                    "status": "unsatisfiable" if solution is None else "solved",
+                    "solution": format_solution(puzzle, solution, output_format),
+                    "cached": True,
+                    "timings": {"total": round(time.perf_counter() - start, 6)},
+                }
+        graph = solve(puzzle, verbose=False, timings=timings, **options)
+    except Exception as error:
+        return {
+            "puzzle": name,
+            "status": "error",
+            "error": f"{type(error).__name__}: {error}",
+            "timings": timings,
+        }
+    timings["total"] = time.perf_counter() - start
+    # [row, column] of both islands and the number of bridges between them
+    solution = None if graph is None else solution_to_list(graph)
+    if cache is not None and options.get("connected", True):
+        cache.put(puzzle, solution)
+    return {
+        "puzzle": name,
+        "status": "unsatisfiable" if graph is None else "solved",
+        "solution": format_solution(puzzle, solution, output_format),
+        "cached": False,
+        "timings": {stage: round(seconds, 6) for stage, seconds in timings.items()},
+    }
+
+
+def _work(conn: Connection, options: Dict, cache: SolutionCache | None, output_format: str):
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        conn.send(solve_record(*job, options, cache, output_format))
+
+
+class SolverPool:
+    """
+    Worker processes with one pipe each. Every worker gets one puzzle at a time,
+    so a puzzle running past its timeout is stopped by killing its worker without affecting
+    the others. This also works for solvers that cannot be interrupted, like CaDiCaL.
+    A killed or crashed worker is replaced by a fresh one.
+    start_method is the multiprocessing start method of the workers, the default of the platform if None.
+    output_format is the format of the solutions in the records, see formats.FORMATS.
+    """
+
+    workers: int
+    options: Dict
+    timeout: float | None
+    cache: SolutionCache | None
+    output_format: str
+
+    def __init__(
+        self,
+        workers: int,
+        options: Dict,
+        timeout: float | None = None,
+        cache: SolutionCache | None = None,
+        start_method: str | None = None,
+        output_format: str = "json",
+    ):
+        self.workers = workers
+        self.options = options
+        self.timeout = timeout
+        self.cache = cache
+        self.output_format = output_format
+        self._context = multiprocessing.get_context(start_method)
+        self._processes: Dict[Connection, multiprocessing.Process] = {}
+
+    def _start(self) -> Connection:
+        conn, child_conn = Pipe()
+        process = self._context.Process(
+            target=_work, args=(child_conn, self.options, self.cache, self.output_format),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self._processes[conn] = process
+        return conn
+
+    def _stop(self, conn: Connection, kill: bool = False):
+        """
+        Stops the worker of the connection, a worker that is already stopped is left alone.
+        A worker that can not be asked to stop any more, e.g. after ctrl-c reached the whole process group,
+        is killed.
+        """
+        process = self._processes.pop(conn, None)
+        if process is None:
+            return
+        if not kill:
+            try:
+                conn.send(None)
+            except OSError:
+                kill = True
+        if kill:
+            process.kill()
+        process.join()
+        conn.close()
+
+    def imap(self, puzzles: Iterable[Tuple[str, str]]) -> Iterator[Dict]:
+        """
+        Yields the record of each puzzle in the order they are finished
+        """
+        puzzles = iter(puzzles)
+        idle = [self._start() for _ in range(self.workers)]
+        # connection -> (name of the puzzle, start time)
+        busy: Dict[Connection, Tuple[str, float]] = {}
+        exhausted = False
+        try:
+            while True:
+                while idle and not exhausted:
+                    job = next(puzzles, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    conn = idle.pop()
+                    conn.send(job)
+                    busy[conn] = (job[0], time.perf_counter())
+                if not busy:
+                    break
+
+                deadline = None
+                if self.timeout is not None:
+                    first = min(started for _, started in busy.values())
+                    deadline = max(0.0, first + self.timeout - time.perf_counter())
+                for conn in wait(list(busy), timeout=deadline):
+                    name, started = busy.pop(conn)
+                    # the connection is back in idle before the record is yielded,
+                    # so it is stopped with the others if the consumer closes the generator
+                    try:
+                        record = conn.recv()
+                    except EOFError:
+                        # the worker died, e.g. out of memory
+                        self._stop(conn, kill=True)
+                        conn = self._start()
+                        record = {
+                            "puzzle": name,
+                            "status": "error",
+                            "error": "worker died",
+                            "timings": {"total": time.perf_counter() - started},
+                        }
+                    idle.append(conn)
+                    yield record
+
+                if self.timeout is None:
+                    continue
+                now = time.perf_counter()
+                for conn, (name, started) in list(busy.items()):
+                    if now - started < self.timeout:
+                        continue
+                    del busy[conn]
+                    self._stop(conn, kill=True)
+                    idle.append(self._start())
+                    yield {
+                        "puzzle": name,
+                        "status": "timeout",
+                        "solution": None,
+                        "timings": {"total": round(now - started, 6)},
+                    }
+        finally:
+            for conn in idle:
+                self._stop(conn)
+            for conn in busy:
+                self._stop(conn, kill=True)
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Solve many puzzles in parallel and write one JSON line per puzzle.",
+    )
+    parser.add_argument(
+        "source",
+        type=str,
+        help='Directory (all .txt files), glob, or "-" to read puzzles one after another from stdin.',
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes, defaults to the number of cores.",
+    )
+    parser.add_argument(
+        "--timeout", type=float, help="Seconds after which a puzzle is given up."
+    )
+    parser.add_argument(
+        "--output", type=str, help="Write the JSON lines to this file instead of stdout."
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="json",
+        help="Format of the solutions: [row, column, row, column, bridges] entries (default), "
+        "ASCII grid or bridge counts.",
+    )
+    add_solve_arguments(parser)
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    pool = SolverPool(
+        args.workers,
+        solve_options(args),
+        args.timeout,
+        make_cache(args),
+        output_format=args.format,
+    )
+    statuses = {}
+    start = time.perf_counter()
+    try:
+        for record in pool.imap(find_puzzles(args.source)):
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    summary = ", ".join(f"{count} {status}" for status, count in statuses.items())
+    print(
+        f"{sum(statuses.values())} puzzles ({summary}) in {time.perf_counter() - start:.3f} seconds",
+        file=sys.stderr,
+    )
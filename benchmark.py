@@ -0,0 +1,347 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from batch import find_puzzles
+from boolean import iter_solver_clauses, stream_dimacs
+from encoder import CARD_ENCODINGS, ArenaEncoder, DirectEncoder, Encoder, UndirectedEncoder
+from generator import generate, parse_size
+from main import SOLVERS, solve_connected
+from reader import read_puzzle_from_string, to_graph
+from simplify import Simplifier
+import tseytin
+
+STAGES = ["parse", "to_graph", "encode", "transform", "serialize", "simplify", "solve"]
+
+# Differences below this many seconds are noise and never count as a regression
+MIN_SECONDS = 0.001
+
+# Modules that are slow to import and must only be imported when they are needed
+HEAVY_MODULES = ["matplotlib", "networkx", "numpy"]
+
+# A small puzzle that is solved right after the import, so everything a headless solve imports is measured
+SMALL_PUZZLE = "5 5\n2.1..\n.....\n4.3.1\n.....\n3...2\n"
+
+
+def _pipeline(puzzle: str, options: Dict, measure: Callable) -> Dict[str, int]:
+    """
+    Runs the puzzle through every stage, measure(stage, function, *args) runs one of them.
+    Returns the number of variables and clauses.
+    """
+    islands, bridges = measure("parse", read_puzzle_from_string, puzzle)
+    graph = measure("to_graph", to_graph, islands, bridges)
+    buffer = io.StringIO()
+    if options["encoding"] in ("direct", "undirected"):
+        undirected = options["encoding"] == "undirected"
+        encoder = (UndirectedEncoder if undirected else DirectEncoder)(options["card_encoding"])
+        clauses, variables = measure("encode", encoder.encode, graph, bridges)
+        clauses = measure("serialize", lambda: list(stream_dimacs(clauses, buffer)))
+        number_of_variables = encoder.pool.top
+    else:
+        encoder = ArenaEncoder() if options["encoding"] == "arena" else Encoder()
+        expression, mapping = measure("encode", encoder.encode, graph, bridges)
+        expression = measure(
+            "transform", tseytin.transform, expression, polarity=options["polarity"]
+        )
+        # numbering the literals is part of the serialization
+        literal_map = {}
+        clauses = measure(
+            "serialize",
+            lambda: list(stream_dimacs(iter_solver_clauses(expression, literal_map), buffer)),
+        )
+        variables = {
+            literal_map[name]: edge for name, edge in mapping.items() if name in literal_map
+        }
+        number_of_variables = len(literal_map)
+    extend = None
+    if options.get("simplify"):
+        simplifier = Simplifier(variables)
+        clauses = measure("simplify", simplifier.simplify, clauses)
+        extend = simplifier.extend
+
+    def solve():
+        solver = SOLVERS[options["solver_name"]]()
+        solver.append_formula(clauses)
+        model = solve_connected(solver, variables, islands, verbose=False, extend=extend)
+        solver.delete()
+        return model
+
+    model = measure("solve", solve)
+    # with simplify, the clauses are the ones the solver gets
+    return {
+        "variables": number_of_variables,
+        "clauses": len(clauses),
+        "bridges": len(bridges),
+        "solved": model is not None,
+    }
+
+
+def benchmark_puzzle(puzzle: str, options: Dict, repeat: int = 3) -> Dict:
+    """
+    Wall time of each stage (the best of repeat runs) and its peak memory,
+    measured in a separate run, because tracing the allocations slows everything down
+    """
+    seconds: Dict[str, float] = {}
+
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        seconds[stage] = min(seconds.get(stage, elapsed), elapsed)
+        return result
+
+    for _ in range(repeat):
+        counts = _pipeline(puzzle, options, timed)
+
+    peak: Dict[str, int] = {}
+
+    def traced(stage, function, *args, **kwargs):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args, **kwargs)
+        peak[stage] = tracemalloc.get_traced_memory()[1] - before
+        return result
+
+    tracemalloc.start()
+    try:
+        _pipeline(puzzle, options, traced)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        **counts,
+        "stages": {
+            stage: {"seconds": round(seconds[stage], 6), "peak_bytes": peak[stage]}
+            for stage in STAGES
+            if stage in seconds
+        },
+    }
+
+
+def run(puzzles: Iterable[Tuple[str, str]], options: Dict, repeat: int = 3) -> Dict:
+    results = {}
+    for name, puzzle in puzzles:
+        results[name] = benchmark_puzzle(puzzle, options, repeat)
+        print(_format_line(name, results[name]), file=sys.stderr)
+    return {
+        "options": options,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "puzzles": results,
+    }
+
+
+def import_time(module: str = "main", repeat: int = 5, statement: str = "") -> Dict:
+    """
+    Seconds to import the module in a fresh interpreter and run the statement after it
+    (the fastest of repeat runs) and the heavy modules that are imported by both
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        f"{statement}\n"
+        "seconds = time.perf_counter() - start\n"
+        f"print(json.dumps([seconds, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))"
+    )
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        seconds, heavy = json.loads(output)
+        best = seconds if best is None else min(best, seconds)
+    return {"seconds": round(best, 6), "heavy_modules": heavy}
+
+
+def generated_puzzles(
+    sizes: List[Tuple[int, int]], density: float = 0.15, seed: int = 0
+) -> Iterator[Tuple[str, str]]:
+    """
+    One generated puzzle per size, the seed keeps them the same between runs
+    """
+    for height, width in sizes:
+        puzzle, _ = generate(height, width, density, seed=seed)
+        yield f"generated:{height}x{width}:{seed}", puzzle
+
+
+def _format_line(name: str, result: Dict) -> str:
+    stages = " ".join(
+        f"{stage} {values['seconds'] * 1000:.1f}ms/{values['peak_bytes'] / 1024:.0f}KiB"
+        for stage, values in result["stages"].items()
+    )
+    return f"{name}: {result['variables']} variables, {result['clauses']} clauses, {stages}"
+
+
+def compare(
+    baseline: Dict,
+    current: Dict,
+    threshold: float = 0.2,
+    reductions: List[str] | None = None,
+) -> List[str]:
+    """
+    Returns a line for every stage of a puzzle whose time or peak memory grew by more than
+    threshold (0.2 is 20%), and for every puzzle whose number of variables or clauses grew.
+    Fewer variables or clauses are no regression, if reductions is given a line for each is added to it.
+    """
+    regressions = []
+    for module, before in baseline.get("imports", {}).items():
+        after = current.get("imports", {}).get(module)
+        if after is None:
+            continue
+        if (
+            after["seconds"] > before["seconds"] * (1 + threshold)
+            and after["seconds"] - before["seconds"] > MIN_SECONDS
+        ):
+            regressions.append(
+                f"import {module}: {before['seconds'] * 1000:.1f}ms -> {after['seconds'] * 1000:.1f}ms"
+            )
+        for heavy in after["heavy_modules"]:
+            if heavy not in before["heavy_modules"]:
+                regressions.append(f"import {module}: imports {heavy}")
+    for name, old in baseline["puzzles"].items():
+        new = current["puzzles"].get(name)
+        if new is None:
+            continue
+        for count in ("variables", "clauses"):
+            if new[count] > old[count]:
+                regressions.append(f"{name}: {count} {old[count]} -> {new[count]}")
+            elif new[count] < old[count] and reductions is not None:
+                reductions.append(f"{name}: {count} {old[count]} -> {new[count]}")
+        for stage, before in old["stages"].items():
+            after = new["stages"].get(stage)
+            if after is None:
+                continue
+            if (
+                after["seconds"] > before["seconds"] * (1 + threshold)
+                and after["seconds"] - before["seconds"] > MIN_SECONDS
+            ):
+                regressions.append(
+                    f"{name}: {stage} {before['seconds'] * 1000:.1f}ms -> {after['seconds'] * 1000:.1f}ms"
+                )
+            if after["peak_bytes"] > before["peak_bytes"] * (1 + threshold):
+                regressions.append(
+                    f"{name}: {stage} {before['peak_bytes']} -> {after['peak_bytes']} bytes peak"
+                )
+    return regressions
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Time every stage of the solver on a set of puzzles and compare the results to a baseline.",
+    )
+    parser.add_argument(
+        "puzzles",
+        type=str,
+        nargs="*",
+        help='Directories (all .txt files), globs, or "-" for puzzles from stdin, '
+        "defaults to data unless puzzles are generated.",
+    )
+    parser.add_argument(
+        "--generate",
+        type=parse_size,
+        action="append",
+        default=[],
+        metavar="SIZE",
+        help='Also benchmark a generated puzzle of this size ("HEIGHTxWIDTH" or "SIZE"), can be repeated.',
+    )
+    parser.add_argument(
+        "--density", type=float, default=0.15, help="Islands per cell of the generated puzzles."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated puzzles.")
+    parser.add_argument(
+        "--encoding", choices=["tseytin", "arena", "direct", "undirected"], default="tseytin"
+    )
+    parser.add_argument(
+        "--card-encoding", choices=list(CARD_ENCODINGS), default="naive"
+    )
+    parser.add_argument("--polarity", action="store_true")
+    parser.add_argument("--simplify", action="store_true", help="Simplify the cnf before solving.")
+    parser.add_argument("--solver", choices=list(SOLVERS), default="minisatgh")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per puzzle, the fastest one counts."
+    )
+    parser.add_argument(
+        "--imports-only",
+        action="store_true",
+        help="Only measure the time to import main and solve a small puzzle, not the puzzles.",
+    )
+    parser.add_argument("--output", type=str, help="Write the results as JSON baseline to this file.")
+    parser.add_argument(
+        "--compare",
+        type=str,
+        metavar="BASELINE",
+        help="Compare the results to this baseline and exit with 1 if anything regressed.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative growth of time or memory that counts as regression (default 0.2).",
+    )
+    args = parser.parse_args(argv)
+
+    options = {
+        "encoding": args.encoding,
+        "card_encoding": args.card_encoding,
+        "polarity": args.polarity,
+        "solver_name": args.solver,
+        "simplify": args.simplify,
+    }
+    sources = args.puzzles or ([] if args.generate else ["data"])
+    puzzles = itertools.chain(
+        (puzzle for source in sources for puzzle in find_puzzles(source)),
+        generated_puzzles(args.generate, args.density, args.seed),
+    )
+    results = run([] if args.imports_only else puzzles, options, args.repeat)
+    results["imports"] = {
+        "main": import_time("main"),
+        # a headless solve of a small puzzle must not pull in anything heavy either
+        "main.solve": import_time(
+            "main", statement=f"main.solve({SMALL_PUZZLE!r}, verbose=False)"
+        ),
+    }
+    for module, values in results["imports"].items():
+        print(
+            f"import {module}: {values['seconds'] * 1000:.1f}ms, "
+            f"heavy modules: {values['heavy_modules'] or 'none'}",
+            file=sys.stderr,
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline["options"] != options:
+            print(f"warning: the baseline was run with {baseline['options']}", file=sys.stderr)
+        reductions = []
+        regressions = compare(baseline, results, args.threshold, reductions)
+        for line in reductions:
+            print(line, file=sys.stderr)
+        for line in regressions:
+            print(line)
+        print(
+            f"{len(regressions)} regressions, {len(reductions)} smaller numbers of variables or clauses",
+            file=sys.stderr,
+        )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from typing import Dict, Tuple
+from array import array
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
 
 
 class Node:
@@ -55,6 +56,98 @@ class Literal(Node):
         return hash(self.name)
 
 
+# Opcodes of the nodes in an arena
+LITERAL = 0
+NOT = 1
+AND = 2
+OR = 3
+
+
+class Arena:
+    """
+    Compact representation of a boolean expression. Instead of one object per node, every node is an
+    integer id into flat arrays: opcodes[id] is the type of the node and its operands are
+    children[offsets[id]:offsets[id + 1]]. And and Or nodes are n-ary, the only "child" of a literal is
+    the index of its name. Nodes are always added after their operands, so the ids are a topological order.
+    """
+
+    __slots__ = ("opcodes", "offsets", "children", "names", "_literals", "_negations", "root")
+
+    def __init__(self):
+        self.opcodes = array("B")
+        self.offsets = array("q", [0])
+        self.children = array("i")
+        self.names: List[str] = []
+        # Literals and negations are shared, so each of them only exists once in the arena
+        self._literals: Dict[str, int] = {}
+        self._negations: Dict[int, int] = {}
+        self.root = -1
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def _add(self, opcode: int, operands: Iterable[int]) -> int:
+        self.opcodes.append(opcode)
+        self.children.extend(operands)
+        self.offsets.append(len(self.children))
+        return len(self.opcodes) - 1
+
+    def operands(self, node: int) -> array:
+        return self.children[self.offsets[node] : self.offsets[node + 1]]
+
+    def name(self, node: int) -> str:
+        return self.names[self.children[self.offsets[node]]]
+
+    def literal(self, name: str) -> int:
+        node = self._literals.get(name)
+        if node is None:
+            self.names.append(name)
+            node = self._add(LITERAL, (len(self.names) - 1,))
+            self._literals[name] = node
+        return node
+
+    def not_(self, operand: int) -> int:
+        node = self._negations.get(operand)
+        if node is None:
+            node = self._add(NOT, (operand,))
+            self._negations[operand] = node
+        return node
+
+    def and_(self, operands: List[int]) -> int:
+        if len(operands) == 1:
+            return operands[0]
+        return self._add(AND, operands)
+
+    def or_(self, operands: List[int]) -> int:
+        if len(operands) == 1:
+            return operands[0]
+        return self._add(OR, operands)
+
+    def __repr__(self):
+        return f"Arena(nodes: {len(self)}, literals: {len(self.names)}, root: {self.root})"
+
+
+def count_nodes(root: Literal | AndNode | OrNode | NotNode | Arena) -> int:
+    """
+    Number of nodes of an expression, nodes used more than once are counted once
+    """
+    if isinstance(root, Arena):
+        return len(root)
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, (AndNode, OrNode)):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, NotNode):
+            stack.append(node.operand)
+    return len(seen)
+
+
 def to_solver_string_recursive(root):
     # Maps literals to integers
     literal_map = {}
@@ -79,62 +172,137 @@ def to_solver_string_recursive(root):
     return dfs(root) + " 0", {v: k for k, v in literal_map.items()}
 
 
-def to_solver_string_iterative(
-    root: Literal | AndNode | OrNode | NotNode,
-) -> Tuple[str, Dict[str, str]]:
+def _iter_arena_clauses(arena: Arena, literal_map: Dict[str, int]) -> Iterator[List[int]]:
     """
-    Transforms a boolean expression in cnf to a string that can be used by a SAT solver.
-    We need to use an iterative approach because the recursive approach would exceed the recursion limit.
+    The clauses of an arena in cnf (an And of Or nodes over literals and negated literals)
+    are the operands of the root, so no traversal of the whole expression is needed.
     """
-    # Mapping to revers the process after the SAT solver has found a solution
-    literal_map = {}
-    next_literal_id = 1
+    opcodes = arena.opcodes
+    root = arena.root
+    clauses = arena.operands(root) if opcodes[root] == AND else (root,)
+    for clause in clauses:
+        stack = [clause]
+        result = []
+        while stack:
+            node = stack.pop()
+            opcode = opcodes[node]
+            if opcode == OR:
+                stack.extend(reversed(arena.operands(node)))
+                continue
+            sign = 1
+            if opcode == NOT:
+                sign = -1
+                node = arena.children[arena.offsets[node]]
+                opcode = opcodes[node]
+            if opcode != LITERAL:
+                raise ValueError(f"Arena is not in cnf, node {node}")
+            name = arena.name(node)
+            if name not in literal_map:
+                literal_map[name] = len(literal_map) + 1
+            result.append(sign * literal_map[name])
+        yield result
 
-    # One stack for the Ast and one for the results
-    stack = [(root, False)]
-    result = []
-    and_counter = 0
-    while stack:
-        node, visited = stack.pop()
 
-        if visited:
-            # popping the node stack and build up the result stack
-            if isinstance(node, Literal):
-                if node.name not in literal_map:
-                    literal_map[node.name] = str(next_literal_id)
-                    next_literal_id += 1
-                result.append(literal_map[node.name])
-            elif isinstance(node, NotNode):
-                result.append(f"-{result.pop()}")
-            elif isinstance(node, AndNode):
-                and_counter += 1
-                right = result.pop()
-                left = result.pop()
-                result.append(f"{left} 0\n{right}")
-            elif isinstance(node, OrNode):
-                right = result.pop()
-                left = result.pop()
-                result.append(f"{left} {right}")
-            else:
-                # if for some reason we encounter an unknown node type, we raise an error
-                # but this should never happen
-                raise ValueError(f"Unknown node type, {node}")
-        else:
-            # Build up the stack of all nodes
-            if isinstance(node, Literal):
-                stack.append((node, True))
+def _iter_node_clauses(
+    root: Literal | AndNode | OrNode | NotNode, literal_map: Dict[str, int]
+) -> Iterator[List[int]]:
+    # One stack for the And nodes and one for the literals of the current clause
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, AndNode):
+            stack.append(node.right)
+            stack.append(node.left)
+            continue
+        clause_stack = [(node, 1)]
+        result = []
+        while clause_stack:
+            node, sign = clause_stack.pop()
+            if isinstance(node, OrNode):
+                clause_stack.append((node.right, sign))
+                clause_stack.append((node.left, sign))
             elif isinstance(node, NotNode):
-                stack.append((node, True))
-                stack.append((node.operand, False))
-            elif isinstance(node, AndNode) or isinstance(node, OrNode):
-                stack.append((node, True))
-                stack.append((node.right, False))
-                stack.append((node.left, False))
+                clause_stack.append((node.operand, -sign))
+            elif isinstance(node, Literal):
+                if node.name not in literal_map:
+                    literal_map[node.name] = len(literal_map) + 1
+                result.append(sign * literal_map[node.name])
             else:
                 # if for some reason we encounter an unknown node type, we raise an error
                 # but this should never happen
                 raise ValueError(f"Unknown node type, {node}")
+        yield result
+
+
+def iter_solver_clauses(
+    root: Literal | AndNode | OrNode | NotNode | Arena, literal_map: Dict[str, int]
+) -> Iterator[List[int]]:
+    """
+    Yields the clauses of a boolean expression in cnf one at a time as lists of integers,
+    so they can be written or handed to a SAT solver without building the whole cnf in memory.
+    literal_map is filled with the integer of every literal name while the clauses are yielded.
+    """
+    if isinstance(root, Arena):
+        return _iter_arena_clauses(root, literal_map)
+    return _iter_node_clauses(root, literal_map)
+
+
+# The header is written with this width first and patched once the clauses are counted
+_HEADER_WIDTH = 48
+
 
-    return f"p cnf {next_literal_id - 1} {and_counter}\n" + result[0] + " 0", {
-        v: k for k, v in literal_map.items()
+def stream_dimacs(
+    clauses: Iterable[List[int]], file: TextIO, chunk_size: int = 4096
+) -> Iterator[List[int]]:
+    """
+    Passes the clauses through while writing them as DIMACS to the file in chunks of chunk_size clauses.
+    The header is patched in when the clauses are exhausted, so the file has to be seekable.
+    """
+    header_position = file.tell()
+    file.write(" " * (_HEADER_WIDTH - 1) + "\n")
+    number_of_variables = 0
+    number_of_clauses = 0
+    lines = []
+    for clause in clauses:
+        for literal in clause:
+            if abs(literal) > number_of_variables:
+                number_of_variables = abs(literal)
+        number_of_clauses += 1
+        lines.append(" ".join(map(str, clause)) + " 0\n")
+        if len(lines) >= chunk_size:
+            file.write("".join(lines))
+            lines.clear()
+        yield clause
+    file.write("".join(lines))
+    end = file.tell()
+    file.seek(header_position)
+    file.write(f"p cnf {number_of_variables} {number_of_clauses}".ljust(_HEADER_WIDTH - 1))
+    file.seek(end)
+
+
+def write_dimacs(
+    clauses: Iterable[List[int]], file: TextIO, chunk_size: int = 4096
+) -> None:
+    """
+    Writes the clauses as DIMACS to the file, see stream_dimacs.
+    """
+    for _ in stream_dimacs(clauses, file, chunk_size):
+        pass
+
+
+def to_solver_string_iterative(
+    root: Literal | AndNode | OrNode | NotNode | Arena,
+) -> Tuple[str, Dict[str, str]]:
+    """
+    Transforms a boolean expression in cnf to a string that can be used by a SAT solver.
+    We need to use an iterative approach because the recursive approach would exceed the recursion limit.
+    Prefer iter_solver_clauses or write_dimacs, they never hold the whole string in memory.
+    """
+    literal_map = {}
+    lines = [
+        " ".join(map(str, clause)) + " 0"
+        for clause in iter_solver_clauses(root, literal_map)
+    ]
+    return f"p cnf {len(literal_map)} {len(lines)}\n" + "\n".join(lines), {
+        str(v): k for k, v in literal_map.items()
     }
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Bumped whenever solutions stored by an older version may be wrong, older caches are emptied.
+# 2: clues above the capacity of an island were satisfiable in the tseytin and arena encodings
+CACHE_VERSION = 2
+
+# A solution is a list of [row, column, row, column, bridges], one entry per pair of islands
+Solution = List[List[int]] | None
+
+
+# Where a cell (row, column) of a grid with the given height and width goes under each of the
+# 8 symmetries of the grid: identity, rotations (clockwise), transposition and reflections
+_SYMMETRIES: List[Callable[[int, int, int, int], Tuple[int, int]]] = [
+    lambda r, c, height, width: (r, c),
+    lambda r, c, height, width: (c, height - 1 - r),
+    lambda r, c, height, width: (height - 1 - r, width - 1 - c),
+    lambda r, c, height, width: (width - 1 - c, r),
+    lambda r, c, height, width: (c, r),
+    lambda r, c, height, width: (r, width - 1 - c),
+    lambda r, c, height, width: (height - 1 - r, c),
+    lambda r, c, height, width: (width - 1 - c, height - 1 - r),
+]
+
+# Index of the inverse of each symmetry above
+_INVERSE = [0, 3, 2, 1, 4, 5, 6, 7]
+
+# Whitespace inside a row is water
+_WATER = str.maketrans(" \t", "..")
+
+
+def _symmetric_grids(rows: List[str]) -> List[List[str]]:
+    """
+    The grid under each of the symmetries in _SYMMETRIES, built with zip and slicing
+    instead of moving every cell one by one
+    """
+    transposed = ["".join(column) for column in zip(*rows)]
+    rotated = ["".join(column) for column in zip(*rows[::-1])]
+    return [
+        rows,
+        rotated,
+        [row[::-1] for row in rows[::-1]],
+        transposed[::-1],
+        transposed,
+        [row[::-1] for row in rows],
+        rows[::-1],
+        rotated[::-1],
+    ]
+
+
+def canonical_form(puzzle: str) -> Tuple[str, int, Tuple[int, int]]:
+    """
+    Returns the hash of the smallest of the 8 symmetric variants of the puzzle,
+    the index of the symmetry that leads to it and the size of the puzzle.
+    Puzzles that are rotations or reflections of each other get the same hash.
+    Rows are padded with water to the width of the header (whitespace is water as well, like in the reader),
+    so short rows or missing rows can not cut the other rows off when the grid is transposed.
+    """
+    lines = puzzle.splitlines()
+    height, width = map(int, lines[0].split())
+    rows = [line.rstrip().translate(_WATER).ljust(width, ".") for line in lines[1 : height + 1]]
+    rows.extend("." * width for _ in range(height - len(rows)))
+    text, index = min(
+        ("\n".join(grid), index) for index, grid in enumerate(_symmetric_grids(rows))
+    )
+    size = (height, width) if index in (0, 2, 5, 6) else (width, height)
+    key = hashlib.sha256(f"{size[0]} {size[1]}\n{text}".encode()).hexdigest()
+    return key, index, (height, width)
+
+
+def _map_solution(
+    solution: Solution, index: int, height: int, width: int
+) -> Solution:
+    if solution is None:
+        return None
+    symmetry = _SYMMETRIES[index]
+    return [
+        [*symmetry(r1, c1, height, width), *symmetry(r2, c2, height, width), count]
+        for r1, c1, r2, c2, count in solution
+    ]
+
+
+class SolutionCache:
+    """
+    On-disk cache of solutions in a SQLite database. Puzzles are stored in their canonical form,
+    so rotated or reflected duplicates are hits as well. When the stored solutions grow beyond
+    max_bytes, the least recently used ones are evicted. The size of the stored solutions is kept
+    as the "bytes" counter, so storing a solution does not sum the whole table.
+    Solutions are keyed by the puzzle only, every encoding has to accept the same solutions,
+    so the database carries CACHE_VERSION and is emptied when it was written by an older version.
+    The connection is opened on first use and not pickled, so every worker process gets its own.
+    """
+
+    directory: Path
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(self, directory: str | Path, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.directory / "solutions.sqlite", timeout=30
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS solutions "
+                "(key TEXT PRIMARY KEY, solution TEXT, size INTEGER, accessed REAL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS solutions_accessed ON solutions (accessed)"
+            )
+            self._upgrade(self._connection)
+        return self._connection
+
+    @staticmethod
+    def _upgrade(connection: sqlite3.Connection):
+        """
+        Empties a cache of an older CACHE_VERSION and sets the "bytes" counter if it is missing
+        """
+        with connection:
+            # take the write lock before reading the version, so only one process empties the cache
+            connection.execute("BEGIN IMMEDIATE")
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < CACHE_VERSION:
+                connection.execute("DELETE FROM solutions")
+                connection.execute("DELETE FROM counters WHERE name = 'bytes'")
+                connection.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+            connection.execute(
+                "INSERT OR IGNORE INTO counters "
+                "SELECT 'bytes', COALESCE(SUM(size), 0) FROM solutions"
+            )
+
+    def _count(self, name: str):
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO counters VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+
+    def get(self, puzzle: str) -> Tuple[bool, Solution]:
+        """
+        Returns if the puzzle is cached and its solution (None if it has none)
+        in the coordinates of the given puzzle
+        """
+        key, index, (height, width) = canonical_form(puzzle)
+        row = self.connection.execute(
+            "SELECT solution FROM solutions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            self._count("misses")
+            return False, None
+        self.hits += 1
+        self._count("hits")
+        with self.connection:
+            self.connection.execute(
+                "UPDATE solutions SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        # move the solution from the canonical grid back to the grid of this puzzle
+        if index in (1, 3, 4, 7):
+            height, width = width, height
+        return True, _map_solution(json.loads(row[0]), _INVERSE[index], height, width)
+
+    def put(self, puzzle: str, solution: Solution):
+        """
+        Stores the solution (None if the puzzle has none) and evicts old entries if the cache is full
+        """
+        key, index, (height, width) = canonical_form(puzzle)
+        text = json.dumps(_map_solution(solution, index, height, width))
+        connection = self.connection
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            replaced = connection.execute(
+                "SELECT size FROM solutions WHERE key = ?", (key,)
+            ).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+                (key, text, len(text), time.time()),
+            )
+            total = connection.execute(
+                "SELECT value FROM counters WHERE name = 'bytes'"
+            ).fetchone()[0]
+            total += len(text) - (replaced[0] if replaced else 0)
+            while total > self.max_bytes:
+                oldest = connection.execute(
+                    "SELECT key, size FROM solutions ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                connection.execute("DELETE FROM solutions WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+            connection.execute("UPDATE counters SET value = ? WHERE name = 'bytes'", (total,))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Hits and misses of this process, of all processes using the cache, and its size
+        """
+        counters = dict(self.connection.execute("SELECT name, value FROM counters"))
+        entries = self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": counters.get("hits", 0),
+            "total_misses": counters.get("misses", 0),
+            "entries": entries,
+            "bytes": counters.get("bytes", 0),
+        }
+
+
+def default_cache_directory() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "hashi-solver"
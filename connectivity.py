@@ -0,0 +1,52 @@
+from typing import Dict, Iterable, List, Tuple
+
+from reader import Island
+
+
+def _components(
+    islands: Iterable[Island], bridges: Iterable[Tuple[Island, Island]]
+) -> Dict[Island, Island]:
+    """
+    Union find over the islands, returns the representative of the component of each island
+    """
+    parent = {island: island for island in islands}
+
+    def find(island: Island) -> Island:
+        root = island
+        while parent[root] is not root:
+            root = parent[root]
+        # path compression, so the next lookup is faster
+        while parent[island] is not root:
+            parent[island], island = root, parent[island]
+        return root
+
+    for x, y in bridges:
+        root_x, root_y = find(x), find(y)
+        if root_x is not root_y:
+            parent[root_x] = root_y
+    return {island: find(island) for island in parent}
+
+
+def cut_clauses(
+    model: List[int],
+    variables: Dict[int, Tuple[Island, Island]],
+    islands: Iterable[Island],
+    fixed: Iterable[Tuple[Island, Island, int]] = (),
+) -> List[List[int]]:
+    """
+    Checks if the bridges of the model, together with the fixed bridges, connect all islands. If not, a clause is returned for each component
+    that requires at least one of the possible bridges leaving the component, otherwise an empty list.
+    A component without possible bridges to the outside gets an empty clause, so the cnf becomes unsatisfiable.
+    """
+    built = [edge for variable, edge in variables.items() if model[variable - 1] > 0]
+    built.extend((x, y) for x, y, _ in fixed)
+    component = _components(islands, built)
+    roots = set(component.values())
+    if len(roots) <= 1:
+        return []
+    cuts = {root: [] for root in roots}
+    for variable, (x, y) in variables.items():
+        if component[x] is not component[y]:
+            cuts[component[x]].append(variable)
+            cuts[component[y]].append(variable)
+    return list(cuts.values())
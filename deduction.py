@@ -0,0 +1,151 @@
+from typing import Dict, List, Tuple
+
+from encoder import find_crossings
+from reader import Island
+
+
+class Deduction:
+    """
+    Result of the deduction pass. The residual islands and bridges are what is left for the encoder:
+    the islands are copies whose number of bridges is reduced by the bridges already fixed,
+    islands without anything left to decide are left out.
+    """
+
+    islands: List[Island]
+    bridges: List[Tuple[Island, Island]]
+    # bridges fixed before solving, between the residual copies of the islands
+    fixed: List[Tuple[Island, Island, int]]
+    # residual copies of all islands, including the ones that are left out
+    nodes: List[Island]
+    unsatisfiable: bool
+    eliminated: int
+
+    def __init__(self, islands, bridges, fixed, nodes, unsatisfiable, eliminated):
+        self.islands = islands
+        self.bridges = bridges
+        self.fixed = fixed
+        self.nodes = nodes
+        self.unsatisfiable = unsatisfiable
+        self.eliminated = eliminated
+
+    def __repr__(self):
+        return (
+            f"Deduction(residual bridges: {len(self.bridges)}, fixed: {len(self.fixed)}, "
+            f"eliminated: {self.eliminated}, unsatisfiable: {self.unsatisfiable})"
+        )
+
+
+def _pairs(bridges: List[Tuple[Island, Island]]) -> List[Tuple[Island, Island]]:
+    """
+    One entry per pair of islands, the reader lists every bridge in both directions
+    """
+    seen = set()
+    pairs = []
+    for x, y in bridges:
+        key = frozenset((x, y))
+        if key not in seen:
+            seen.add(key)
+            pairs.append((x, y))
+    return pairs
+
+
+def deduce(
+    islands: List[Island],
+    bridges: List[Tuple[Island, Island]],
+    connected: bool = True,
+) -> Deduction:
+    """
+    Repeatedly applies local Hashi rules to the lower (lo) and upper (hi) number of bridges of every pair:
+    - a pair never gets more bridges than 2 or than the number of either island
+    - an island needs at least number - (sum of hi of its other pairs) bridges on each pair,
+      e.g. an 8 with four neighbours or a 4 with two neighbours needs 2 bridges everywhere
+    - an island gets at most number - (sum of lo of its other pairs) bridges on each pair
+    - a pair with at least one bridge forbids all pairs crossing it
+    - if all islands have to be connected: two 1s are never connected and two 2s never with 2 bridges,
+      because they would be cut off from the rest of the puzzle
+    """
+    pairs = _pairs(bridges)
+    incident: Dict[Island, List[int]] = {island: [] for island in islands}
+    for index, (x, y) in enumerate(pairs):
+        incident[x].append(index)
+        incident[y].append(index)
+    index_of = {pair: index for index, pair in enumerate(pairs)}
+    crossing: List[List[int]] = [[] for _ in pairs]
+    for (vertical,), (horizontal,) in find_crossings(pairs):
+        crossing[index_of[vertical]].append(index_of[horizontal])
+        crossing[index_of[horizontal]].append(index_of[vertical])
+
+    lo = [0] * len(pairs)
+    hi = [min(2, x.number_of_bridges, y.number_of_bridges) for x, y in pairs]
+    if connected and len(islands) > 2:
+        for index, (x, y) in enumerate(pairs):
+            if x.number_of_bridges == y.number_of_bridges and x.number_of_bridges <= 2:
+                hi[index] = min(hi[index], x.number_of_bridges - 1)
+
+    unsatisfiable = False
+    changed = True
+    while changed and not unsatisfiable:
+        changed = False
+        for island in islands:
+            edges = incident[island]
+            number = island.number_of_bridges
+            total_lo = sum(lo[e] for e in edges)
+            total_hi = sum(hi[e] for e in edges)
+            if total_lo > number or total_hi < number:
+                unsatisfiable = True
+                break
+            for e in edges:
+                lower = number - (total_hi - hi[e])
+                upper = number - (total_lo - lo[e])
+                if lower > lo[e]:
+                    total_lo += lower - lo[e]
+                    lo[e] = lower
+                    changed = True
+                if upper < hi[e]:
+                    total_hi -= hi[e] - upper
+                    hi[e] = upper
+                    changed = True
+                if lo[e] > hi[e]:
+                    unsatisfiable = True
+                    break
+            if unsatisfiable:
+                break
+        for e in range(len(pairs)):
+            if lo[e] == 0:
+                continue
+            for other in crossing[e]:
+                if hi[other] > 0:
+                    if lo[other] > 0:
+                        unsatisfiable = True
+                    hi[other] = 0
+                    changed = True
+
+    # residual copies of the islands, their number is reduced by the fixed bridges
+    copies = {
+        island: Island(island.x, island.y, island.number_of_bridges, island.name)
+        for island in islands
+    }
+    fixed = []
+    residual_bridges = []
+    for index, (x, y) in enumerate(pairs):
+        if lo[index] > 0:
+            copies[x].number_of_bridges -= lo[index]
+            copies[y].number_of_bridges -= lo[index]
+            fixed.append((copies[x], copies[y], lo[index]))
+        # every bridge that is still open is one directed edge, like in the reader
+        open_bridges = [(copies[x], copies[y]), (copies[y], copies[x])]
+        residual_bridges.extend(open_bridges[: max(0, hi[index] - lo[index])])
+    open_islands = {island for bridge in residual_bridges for island in bridge}
+    residual_islands = [
+        copy
+        for copy in copies.values()
+        if copy in open_islands or copy.number_of_bridges != 0
+    ]
+    return Deduction(
+        residual_islands,
+        residual_bridges,
+        fixed,
+        list(copies.values()),
+        unsatisfiable,
+        len(bridges) - len(residual_bridges),
+    )
@@ -1,11 +1,67 @@
+from bisect import bisect_left, bisect_right, insort
 from itertools import combinations
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
-import networkx as nx
+from pysat.card import CardEnc, EncType
+from pysat.formula import IDPool
 
-from boolean import Literal, NotNode, OrNode, AndNode
+from boolean import Arena, Literal, NotNode, OrNode, AndNode
 from reader import Island
 
+if TYPE_CHECKING:
+    from graph import BridgeGraph
+
+# Name of a literal that is only used together with its negation, for constraints that can never hold
+FALSE = "false"
+
+
+def find_crossings(
+    bridges: List[Tuple[Island, Island]],
+) -> List[Tuple[List[Tuple[Island, Island]], List[Tuple[Island, Island]]]]:
+    """
+    Returns (vertical, horizontal) for every pair of crossing bridges, each side holds
+    the given (directed) bridges between the same two islands.
+    Sweeps over the rows: the vertical bridges spanning the current row are kept sorted by column,
+    so the ones crossing a horizontal bridge are found with two binary searches.
+    This takes O((B + K) log B) for B bridges and K crossings instead of checking all pairs.
+    """
+    # both directions of a bridge belong to the same segment
+    segments: Dict[frozenset, List[Tuple[Island, Island]]] = {}
+    for bridge in bridges:
+        segments.setdefault(frozenset(bridge), []).append(bridge)
+
+    # (row, kind, segment): at the same row the vertical bridges ending there are removed first,
+    # then the horizontal bridges are checked and then the vertical bridges starting there are added,
+    # so only bridges passing strictly between two islands cross
+    REMOVE, QUERY, ADD = 0, 1, 2
+    events = []
+    for directed in segments.values():
+        p, q = directed[0]
+        if p.y == q.y:
+            events.append((min(p.x, q.x), ADD, directed))
+            events.append((max(p.x, q.x), REMOVE, directed))
+        elif p.x == q.x:
+            events.append((p.x, QUERY, directed))
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    # a column is spanned by at most one vertical bridge at a time, it would cross islands otherwise
+    columns: List[int] = []
+    active: Dict[int, List[Tuple[Island, Island]]] = {}
+    crossings = []
+    for _, kind, directed in events:
+        p, q = directed[0]
+        if kind == ADD:
+            insort(columns, p.y)
+            active[p.y] = directed
+        elif kind == REMOVE:
+            del columns[bisect_left(columns, p.y)]
+            del active[p.y]
+        else:
+            left, right = min(p.y, q.y), max(p.y, q.y)
+            for column in columns[bisect_right(columns, left) : bisect_left(columns, right)]:
+                crossings.append((active[column], directed))
+    return crossings
+
 
 class Encoder:
     def _build_and(self, literals: List[Literal]) -> AndNode | Literal:
@@ -28,15 +84,16 @@ class Encoder:
 
     @staticmethod
     def _node_edges_to_literals(
-        node: Island, graph: nx.MultiDiGraph, mapping: Dict[str, Tuple[Island, Island]]
+        node: Island, graph: "BridgeGraph", mapping: Dict[str, Tuple[Island, Island]]
     ) -> List[Literal]:
         """
         Converts in and out going edges of a node to a list of literals.
         And create a mapping, so we can translate the literals back to the edges.
         """
         bridges = []
-        for edge in list(graph.in_edges(node)) + list(graph.out_edges(node)):
-            bridge = "".join([str(e) for e in edge])
+        for edge in graph.incident_edges(node):
+            # The separator keeps e.g. "1" + "12" and "11" + "2" apart
+            bridge = "_".join([str(e) for e in edge])
             bridges.append(Literal(bridge))
             if mapping.get(bridge) is None:
                 mapping[bridge] = edge
@@ -44,7 +101,7 @@ class Encoder:
 
     def _build_node(
         self,
-        graph: nx.MultiDiGraph,
+        graph: "BridgeGraph",
         node: Island,
         mapping: Dict[str, Tuple[Island, Island]],
     ) -> Literal | AndNode | OrNode | NotNode:
@@ -54,6 +111,10 @@ class Encoder:
         num = node.number_of_bridges
         bridges = Encoder._node_edges_to_literals(node, graph, mapping)
 
+        # If the island needs more bridges than it has available, the puzzle has no solution.
+        # Without this, abs(num - len(bridges)) below would negate some of the bridges instead.
+        if num > len(bridges):
+            return AndNode(Literal(FALSE), NotNode(Literal(FALSE)))
         # If the number of available bridges is equal to the number of bridges
         # than we add them all with and because they are all required.
         if len(bridges) == num:
@@ -99,7 +160,7 @@ class Encoder:
         return self._build_or(ands)
 
     def encode(
-        self, graph: nx.MultiDiGraph, bridges: List[Tuple[Island, Island]]
+        self, graph: "BridgeGraph", bridges: List[Tuple[Island, Island]]
     ) -> Tuple[AndNode | Literal, Dict[str, Tuple[Island, Island]]]:
         """
         Transform the given graph into a boolean ast
@@ -126,47 +187,270 @@ class Encoder:
 
     def encode_crossing_bridges(self, crossing_bridges: List[str]) -> AndNode | None:
         """
-        build ast for each crossing bridges. CNF of "A -> ~B" is "¬A ∨ ¬B"
+        build ast for a bridge (the first one) and the bridges crossing it. CNF of "A -> ~B" is "¬A ∨ ¬B"
         """
-        if len(crossing_bridges) == 0:
+        if len(crossing_bridges) < 2:
             return None
+        bridge = NotNode(Literal(crossing_bridges[0]))
         nodes = [
-            AndNode(
-                OrNode(
-                    NotNode(Literal(crossing_bridges[0])),
-                    NotNode(Literal(crossing_bridges[1])),
-                ),
-                OrNode(
-                    NotNode(Literal(crossing_bridges[0])),
-                    NotNode(Literal(crossing_bridges[2])),
-                ),
-            )
+            OrNode(bridge, NotNode(Literal(other))) for other in crossing_bridges[1:]
         ]
-        if len(nodes) > 0:
-            return self._build_and(nodes)
+        return self._build_and(nodes)
 
     def _find_crossing_bridges(
         self, bridges: List[Tuple[Island, Island]]
     ) -> AndNode | None:
         """
-        find possible intersecting bridges through the intersecting islands and add ast
-        """
-        final_ast = None
-        for i in range(len(bridges)):
-            for j in range(len(bridges)):
-                if Encoder._do_intersect(
-                    bridges[i][0], bridges[i][1], bridges[j][0], bridges[j][1]
-                ):
-                    b1 = [island.name for island in bridges[i]]
-                    b2 = [island.name for island in bridges[j]]
-                    b3 = [island.name for island in bridges[j][::-1]]
-                    ast = self.encode_crossing_bridges(
-                        ["".join(b1), "".join(b2), "".join(b3)]
-                    )
-                    if ast is None:
-                        continue
-                    if final_ast is None:
-                        final_ast = ast
-                    else:
-                        final_ast = AndNode(final_ast, ast)
-        return final_ast
+        find intersecting bridges with find_crossings and add ast,
+        every direction of the vertical bridge excludes every direction of the horizontal one
+        """
+        nodes = []
+        for vertical, horizontal in find_crossings(bridges):
+            others = ["_".join(map(str, bridge)) for bridge in horizontal]
+            for bridge in vertical:
+                nodes.append(
+                    self.encode_crossing_bridges(["_".join(map(str, bridge)), *others])
+                )
+        if len(nodes) == 0:
+            return None
+        return self._build_and(nodes)
+
+
+class ArenaEncoder:
+    """
+    Same encoding as Encoder, but the ast is built in an Arena with n-ary and/or nodes
+    instead of chains of binary node objects.
+    """
+
+    arena: Arena
+
+    def __init__(self):
+        self.arena = Arena()
+
+    def _node_edges_to_literals(
+        self,
+        node: Island,
+        graph: "BridgeGraph",
+        mapping: Dict[str, Tuple[Island, Island]],
+    ) -> List[int]:
+        """
+        Converts in and out going edges of a node to a list of literal nodes.
+        And create a mapping, so we can translate the literals back to the edges.
+        """
+        bridges = []
+        for edge in graph.incident_edges(node):
+            bridge = "_".join([str(e) for e in edge])
+            bridges.append(self.arena.literal(bridge))
+            if mapping.get(bridge) is None:
+                mapping[bridge] = edge
+        return bridges
+
+    def _build_node(
+        self,
+        graph: "BridgeGraph",
+        node: Island,
+        mapping: Dict[str, Tuple[Island, Island]],
+    ) -> int:
+        """
+        build the bridges of the given node, see Encoder._build_node for the details
+        """
+        num = node.number_of_bridges
+        bridges = self._node_edges_to_literals(node, graph, mapping)
+        if num > len(bridges):
+            false = self.arena.literal(FALSE)
+            return self.arena.and_([false, self.arena.not_(false)])
+        if len(bridges) == num:
+            return self.arena.and_(bridges)
+        ands = []
+        for combination in combinations(range(len(bridges)), abs(num - len(bridges))):
+            transformed = bridges.copy()
+            for i in combination:
+                transformed[i] = self.arena.not_(bridges[i])
+            ands.append(self.arena.and_(transformed))
+        return self.arena.or_(ands)
+
+    def encode(
+        self, graph: "BridgeGraph", bridges: List[Tuple[Island, Island]]
+    ) -> Tuple[Arena, Dict[str, Tuple[Island, Island]]]:
+        """
+        Transform the given graph into an arena, its root is the whole expression
+        """
+        mapping = {}
+        nodes = [self._build_node(graph, node, mapping) for node in graph.nodes]
+        nodes.extend(self._find_crossing_bridges(bridges))
+        self.arena.root = self.arena.and_(nodes)
+        return self.arena, mapping
+
+    def _find_crossing_bridges(self, bridges: List[Tuple[Island, Island]]) -> List[int]:
+        """
+        find intersecting bridges, see Encoder._find_crossing_bridges
+        """
+        arena = self.arena
+        nodes = []
+        for vertical, horizontal in find_crossings(bridges):
+            others = [
+                arena.not_(arena.literal("_".join(map(str, bridge))))
+                for bridge in horizontal
+            ]
+            for bridge in vertical:
+                negated = arena.not_(arena.literal("_".join(map(str, bridge))))
+                nodes.extend(arena.or_([negated, other]) for other in others)
+        return nodes
+
+
+# Cardinality encodings for "exactly n of the bridges of an island", naive expands all combinations
+CARD_ENCODINGS = {
+    "naive": None,
+    "seqcounter": EncType.seqcounter,
+    "totalizer": EncType.totalizer,
+    "sortnetwork": EncType.sortnetwrk,
+}
+
+
+class DirectEncoder:
+    """
+    Encodes the graph straight into integer clauses (DIMACS style) without building an ast,
+    so neither the tseytin transformation nor the string conversion is needed.
+    """
+
+    pool: IDPool
+    card_encoding: str
+
+    def __init__(self, card_encoding: str = "naive"):
+        if card_encoding not in CARD_ENCODINGS:
+            raise ValueError(f"Unknown cardinality encoding, {card_encoding}")
+        # One pool for all variables, so every edge keeps the same id in all clauses
+        # and the auxiliary variables of the cardinality encodings come after them
+        self.pool = IDPool()
+        self.card_encoding = card_encoding
+
+    def _node_edges_to_variables(self, node: Island, graph: "BridgeGraph") -> List[int]:
+        """
+        Converts in and out going edges of a node to a list of variables.
+        """
+        return [
+            self.pool.id(edge)
+            for edge in graph.incident_edges(node)
+        ]
+
+    def _exactly(self, variables: List[int], num: int) -> List[List[int]]:
+        """
+        Clauses for "exactly num of the variables are true" in the selected cardinality encoding.
+        """
+        if num > len(variables):
+            # The island can never get enough bridges, the empty clause makes the cnf unsatisfiable
+            return [[]]
+        encoding = CARD_ENCODINGS[self.card_encoding]
+        if encoding is None:
+            return self._exactly_naive(variables, num)
+        return CardEnc.equals(
+            lits=variables, bound=num, vpool=self.pool, encoding=encoding
+        ).clauses
+
+    @staticmethod
+    def _exactly_naive(variables: List[int], num: int) -> List[List[int]]:
+        """
+        Clauses for "exactly num of the variables are true" without auxiliary variables.
+        For example, exactly 2 of [1, 2, 3]:
+        at most 2  -> no 3 of them are true at the same time: [-1, -2, -3]
+        at least 2 -> of every 2 of them one has to be true: [1, 2], [1, 3], [2, 3]
+        """
+        clauses = [
+            [-variable for variable in combination]
+            for combination in combinations(variables, num + 1)
+        ]
+        clauses.extend(
+            list(combination)
+            for combination in combinations(variables, len(variables) - num + 1)
+        )
+        return clauses
+
+    def encode(
+        self, graph: "BridgeGraph", bridges: List[Tuple[Island, Island]]
+    ) -> Tuple[List[List[int]], Dict[int, Tuple[Island, Island]]]:
+        """
+        Transform the given graph into a list of clauses
+        """
+        mapping = self.allocate(graph)
+        clauses = []
+        for node in graph.nodes:
+            clauses.extend(self.encode_island(graph, node))
+        clauses.extend(self.encode_bridges(mapping, bridges))
+        return clauses, mapping
+
+    def allocate(self, graph: "BridgeGraph") -> Dict[int, Tuple[Island, Island]]:
+        """
+        The variable of every bridge. The edges are allocated before anything else,
+        so the bridges are always the variables 1..n
+        """
+        return {self.pool.id(edge): edge for edge in graph.edges()}
+
+    def encode_island(
+        self, graph: "BridgeGraph", node: Island, number: int | None = None
+    ) -> List[List[int]]:
+        """
+        Clauses for "the island has number bridges", its own number by default
+        """
+        variables = self._node_edges_to_variables(node, graph)
+        return self._exactly(variables, node.number_of_bridges if number is None else number)
+
+    def encode_bridges(
+        self, mapping: Dict[int, Tuple[Island, Island]], bridges: List[Tuple[Island, Island]]
+    ) -> List[List[int]]:
+        """
+        Clauses between the bridges that do not depend on the numbers of the islands
+        """
+        return self._find_crossing_bridges(bridges)
+
+    def _find_crossing_bridges(
+        self, bridges: List[Tuple[Island, Island]]
+    ) -> List[List[int]]:
+        """
+        find intersecting bridges and forbid them. CNF of "A -> ~B" is "¬A ∨ ¬B"
+        """
+        clauses = []
+        for vertical, horizontal in find_crossings(bridges):
+            others = [-self.pool.id(bridge) for bridge in horizontal]
+            for bridge in vertical:
+                variable = -self.pool.id(bridge)
+                clauses.extend([variable, other] for other in others)
+        return clauses
+
+
+class UndirectedEncoder(DirectEncoder):
+    """
+    DirectEncoder with one canonical pair of variables per pair of islands instead of one
+    variable per direction. In the directed encoding a single bridge has two models (either
+    direction is true), so every branch with a single bridge is searched twice. Here the lower
+    variable of a pair, b1, means "at least one bridge" and the other one, b2, means "two bridges",
+    with b2 -> b1, so every number of bridges has exactly one model. The degree of an island is
+    still the number of true variables of its pairs, and crossing bridges only have to exclude
+    each other's b1. b1 and b2 are the variables of the two directions of the pair, so decoding
+    and the connectivity cuts work the same as for the directed encoding. A pair with a single
+    direction (at most one bridge left after deduction) only gets b1.
+    """
+
+    def encode_bridges(
+        self, mapping: Dict[int, Tuple[Island, Island]], bridges: List[Tuple[Island, Island]]
+    ) -> List[List[int]]:
+        """
+        The crossings and b2 -> b1 for every pair
+        """
+        clauses = super().encode_bridges(mapping, bridges)
+        # the variables are allocated in order, so b1 comes first in every pair
+        pairs: Dict[frozenset, List[int]] = {}
+        for variable, edge in mapping.items():
+            pairs.setdefault(frozenset(edge), []).append(variable)
+        clauses.extend([-b2, b1] for b1, *rest in pairs.values() for b2 in rest)
+        return clauses
+
+    def _find_crossing_bridges(
+        self, bridges: List[Tuple[Island, Island]]
+    ) -> List[List[int]]:
+        """
+        find intersecting bridges and forbid them, b2 implies b1, so "¬b1 ∨ ¬b1'" is enough
+        """
+        return [
+            [-min(map(self.pool.id, vertical)), -min(map(self.pool.id, horizontal))]
+            for vertical, horizontal in find_crossings(bridges)
+        ]
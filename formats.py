@@ -0,0 +1,87 @@
+import json
+from typing import List
+
+from reader import read_puzzle_from_string
+
+# Output formats of a solution: the [row, column, row, column, bridges] entries as JSON,
+# the puzzle with the bridges drawn in, or the number of bridges of every island to the right and below
+FORMATS = ["json", "ascii", "counts"]
+
+# (single, double) bridge characters
+_HORIZONTAL = (ord("-"), ord("="))
+_VERTICAL = (ord("|"), ord('"'))
+
+
+def _rows(puzzle: str) -> List[bytearray]:
+    """
+    The cells of the puzzle, one bytearray per row, padded with water to the width of the header
+    """
+    lines = puzzle.splitlines()
+    height, width = map(int, lines[0].split())
+    rows = [bytearray(line[:width].ljust(width, ".").encode()) for line in lines[1 : height + 1]]
+    rows.extend(bytearray(b"." * width) for _ in range(height - len(rows)))
+    return rows
+
+
+def to_ascii(puzzle: str, solution: List[List[int]]) -> str:
+    """
+    The puzzle with the bridges drawn over the water: - and = for one and two horizontal bridges,
+    | and " for one and two vertical bridges
+    """
+    rows = _rows(puzzle)
+    for r1, c1, r2, c2, count in solution:
+        if r1 == r2:
+            low, high = sorted((c1, c2))
+            rows[r1][low + 1 : high] = bytes([_HORIZONTAL[count - 1]]) * (high - low - 1)
+        else:
+            low, high = sorted((r1, r2))
+            for r in range(low + 1, high):
+                rows[r][c1] = _VERTICAL[count - 1]
+    return "\n".join(row.decode() for row in rows)
+
+
+def to_counts(puzzle: str, solution: List[List[int]]) -> str:
+    """
+    Two digits per island, in row-major order: the number of bridges to the next island to the right
+    and to the next island below. Together with the puzzle this is the whole solution.
+    """
+    islands, _ = read_puzzle_from_string(puzzle)
+    numbers = {(island.x, island.y): i for i, island in enumerate(islands)}
+    counts = bytearray(b"0" * (2 * len(islands)))
+    for r1, c1, r2, c2, count in solution:
+        first = numbers[min((r1, c1), (r2, c2))]
+        counts[2 * first + (r1 != r2)] = ord("0") + count
+    return counts.decode()
+
+
+def format_solution(puzzle: str, solution: List[List[int]] | None, output_format: str):
+    """
+    The solution in one of FORMATS, None stays None. json keeps the list of entries,
+    so it can be embedded into other documents.
+    """
+    if solution is None or output_format == "json":
+        return solution
+    if output_format == "ascii":
+        return to_ascii(puzzle, solution)
+    if output_format == "counts":
+        return to_counts(puzzle, solution)
+    raise ValueError(f"Unknown output format {output_format!r}")
+
+
+def print_solution(
+    puzzle: str, solution: List[List[int]] | None, output_format: str, status: str | None = None
+):
+    """
+    Writes the solution to stdout, a missing solution is written as null in json
+    and as "No solution found" otherwise. The status defaults to solved or unsatisfiable,
+    a cnf without the mapping of its bridges is only known to be "satisfiable".
+    """
+    formatted = format_solution(puzzle, solution, output_format)
+    if status is None:
+        status = "unsatisfiable" if solution is None else "solved"
+    if output_format == "json":
+        print(json.dumps({"status": status, "solution": formatted}))
+    elif formatted is None:
+        print("Satisfiable, no bridges to show" if status == "satisfiable" else "No solution found")
+    else:
+        print(formatted)
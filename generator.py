@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import random
+import sys
+from typing import List, Tuple
+
+# A solution is a list of [row, column, row, column, bridges], one entry per pair of islands,
+# the same as in the solution cache
+Solution = List[List[int]]
+
+# Cells of the grid
+WATER = 0
+ISLAND = 1
+HORIZONTAL = 2
+VERTICAL = 3
+
+# (row step, column step, cell of a bridge in this direction)
+_DIRECTIONS = [(1, 0, VERTICAL), (-1, 0, VERTICAL), (0, 1, HORIZONTAL), (0, -1, HORIZONTAL)]
+
+# Number of bridges of a cell -> its character in the puzzle
+_CELLS = bytes.maketrans(bytes(range(9)), b".12345678")
+
+
+def generate(
+    height: int,
+    width: int,
+    density: float = 0.15,
+    double: float = 0.3,
+    cycles: float = 0.1,
+    max_length: int = 6,
+    seed: int | None = None,
+) -> Tuple[str, Solution]:
+    """
+    Generates a solvable puzzle in the format of the reader and a solution of it.
+    Starting from one island, a random island is picked again and again and a bridge is drawn from it
+    over free water to a new island, until density (islands per cell) is reached or there is no room left.
+    Islands without any free direction are dropped from the candidates, so picks never fail twice.
+    The bridges grow like a tree, so they connect all islands, and they never cross because the cells
+    of a bridge are marked in the grid. With the probability cycles a new island also gets a bridge
+    to the next island in another direction, so not every puzzle is a tree. Every bridge is doubled
+    with the probability double, the number of an island is the sum of its bridges.
+    The grid is one bytearray, so even 1000x1000 puzzles only take a few MB.
+    Puzzles can have more than one solution, the returned one is always valid.
+    """
+    rng = random.Random(seed)
+    grid = bytearray(height * width)
+    numbers = bytearray(height * width)
+    islands: List[int] = []
+    solution: Solution = []
+    target = max(2, int(density * height * width))
+
+    def is_free(r: int, c: int) -> bool:
+        """
+        Water without an island next to it, so islands are never direct neighbours
+        """
+        if grid[r * width + c] != WATER:
+            return False
+        for dr, dc, _ in _DIRECTIONS:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < height and 0 <= nc < width and grid[nr * width + nc] == ISLAND:
+                return False
+        return True
+
+    def connect(start: int, end: int, dr: int, dc: int, kind: int, length: int):
+        count = 2 if rng.random() < double else 1
+        for step in range(1, length):
+            grid[start + step * (dr * width + dc)] = kind
+        numbers[start] += count
+        numbers[end] += count
+        solution.append(
+            [start // width, start % width, end // width, end % width, count]
+        )
+
+    first = rng.randrange(height * width)
+    grid[first] = ISLAND
+    islands.append(first)
+    # islands that may still get a new bridge, an island without any free direction never gets one again
+    active = [first]
+
+    while active and len(islands) < target:
+        index = rng.randrange(len(active))
+        start = active[index]
+        r, c = divmod(start, width)
+        # every (direction, length) whose cells in between are water and whose end is free
+        options = []
+        for dr, dc, kind in _DIRECTIONS:
+            for length in range(1, max_length + 1):
+                er, ec = r + dr * length, c + dc * length
+                if not (0 <= er < height and 0 <= ec < width) or grid[er * width + ec] != WATER:
+                    break
+                if length > 1 and is_free(er, ec):
+                    options.append((dr, dc, kind, length))
+        if not options:
+            active[index] = active[-1]
+            active.pop()
+            continue
+        dr, dc, kind, length = options[rng.randrange(len(options))]
+        er, ec = r + dr * length, c + dc * length
+        end = er * width + ec
+        connect(start, end, dr, dc, kind, length)
+        grid[end] = ISLAND
+        islands.append(end)
+        active.append(end)
+
+        if rng.random() < cycles:
+            # a second bridge from the new island to the next island in a random other direction
+            dr, dc, kind = _DIRECTIONS[rng.randrange(4)]
+            nr, nc, length = er + dr, ec + dc, 1
+            while 0 <= nr < height and 0 <= nc < width and grid[nr * width + nc] == WATER:
+                nr, nc, length = nr + dr, nc + dc, length + 1
+            if (
+                0 <= nr < height
+                and 0 <= nc < width
+                and grid[nr * width + nc] == ISLAND
+                and length > 1
+            ):
+                connect(end, nr * width + nc, dr, dc, kind, length)
+
+    if len(islands) < 2:
+        raise ValueError(f"Could not place two islands on {height}x{width}")
+
+    # every island has at least one bridge, so a number of 0 is water
+    cells = numbers.translate(_CELLS)
+    rows = [cells[r * width : (r + 1) * width].decode() for r in range(height)]
+    return f"{height} {width}\n" + "\n".join(rows) + "\n", solution
+
+
+def parse_size(text: str) -> Tuple[int, int]:
+    """
+    "100x200" or "100" (square) as (height, width)
+    """
+    height, _, width = text.lower().partition("x")
+    return int(height), int(width or height)
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Generate solvable puzzles together with a solution.",
+    )
+    parser.add_argument("size", type=parse_size, help='Size of the grid, "HEIGHTxWIDTH" or "SIZE".')
+    parser.add_argument(
+        "--density", type=float, default=0.15, help="Islands per cell (default 0.15)."
+    )
+    parser.add_argument(
+        "--double",
+        type=float,
+        default=0.3,
+        help="Probability that a bridge is doubled (default 0.3).",
+    )
+    parser.add_argument(
+        "--cycles",
+        type=float,
+        default=0.1,
+        help="Probability that a new island gets a second bridge (default 0.1).",
+    )
+    parser.add_argument(
+        "--max-length", type=int, default=6, help="Longest bridge in cells (default 6)."
+    )
+    parser.add_argument("--seed", type=int, help="Seed of the first puzzle, the next ones count up.")
+    parser.add_argument("--count", type=int, default=1, help="Number of puzzles.")
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Directory for the puzzles (.txt) and their solutions (.solution.json). "
+        "Without it, the puzzles are written one after another to stdout.",
+    )
+    args = parser.parse_args(argv)
+
+    height, width = args.size
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    for index in range(args.count):
+        seed = None if args.seed is None else args.seed + index
+        puzzle, solution = generate(
+            height,
+            width,
+            args.density,
+            args.double,
+            args.cycles,
+            args.max_length,
+            seed,
+        )
+        if not args.output:
+            sys.stdout.write(puzzle)
+            continue
+        name = os.path.join(args.output, f"generated_{height}x{width}_{index}")
+        with open(f"{name}.txt", "w") as file:
+            file.write(puzzle)
+        with open(f"{name}.solution.json", "w") as file:
+            json.dump(solution, file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from array import array
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from reader import Island
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+class BridgeGraph:
+    """
+    The islands and the (directed) bridges between them. Islands are numbered by their index
+    in islands, the bridges are stored as arrays of the numbers of their islands, plus both directions
+    of adjacency in CSR form: the bridges going out of island i are out_index[out_offsets[i]:out_offsets[i + 1]],
+    the same for in_index. The same pair of islands can be listed more than once (a double bridge
+    in a solution). Removed bridges are only marked in active, the arrays are never rebuilt.
+    The arrays are arrays of the standard library, importing numpy would take longer than solving
+    most puzzles.
+    """
+
+    islands: List[Island]
+    bridges: List[Tuple[Island, Island]]
+    sources: array
+    targets: array
+    # one byte per bridge, 1 while the bridge is part of the graph
+    active: bytearray
+    out_offsets: array
+    out_index: array
+    in_offsets: array
+    in_index: array
+
+    def __init__(self, islands: List[Island], bridges: List[Tuple[Island, Island]]):
+        self.islands = islands
+        self.bridges = bridges
+        self._ids: Dict[Island, int] = {island: i for i, island in enumerate(islands)}
+        self.sources = array("i", [self._ids[x] for x, _ in bridges])
+        self.targets = array("i", [self._ids[y] for _, y in bridges])
+        self.active = bytearray(b"\1" * len(bridges))
+        self.out_offsets, self.out_index = self._csr(self.sources)
+        self.in_offsets, self.in_index = self._csr(self.targets)
+
+    def _csr(self, ends: array) -> Tuple[array, array]:
+        # counting sort, so the bridges of an island keep the order of the reader
+        offsets = array("q", bytes(8 * (len(self.islands) + 1)))
+        for end in ends:
+            offsets[end + 1] += 1
+        for i in range(len(self.islands)):
+            offsets[i + 1] += offsets[i]
+        position = offsets[:-1]
+        index = array("i", bytes(4 * len(ends)))
+        for e, end in enumerate(ends):
+            index[position[end]] = e
+            position[end] += 1
+        return offsets, index
+
+    @property
+    def nodes(self) -> List[Island]:
+        return self.islands
+
+    def __len__(self):
+        return len(self.islands)
+
+    def _edges(self, offsets: array, edges: array, node: Island) -> List[int]:
+        i = self._ids[node]
+        active = self.active
+        return [e for e in edges[offsets[i] : offsets[i + 1]] if active[e]]
+
+    def in_edges(self, node: Island) -> List[Tuple[Island, Island]]:
+        return [self.bridges[e] for e in self._edges(self.in_offsets, self.in_index, node)]
+
+    def out_edges(self, node: Island) -> List[Tuple[Island, Island]]:
+        return [self.bridges[e] for e in self._edges(self.out_offsets, self.out_index, node)]
+
+    def incident_edges(self, node: Island) -> List[Tuple[Island, Island]]:
+        """
+        The bridges coming in and going out of the island, in this order
+        """
+        return self.in_edges(node) + self.out_edges(node)
+
+    def edges(self) -> List[Tuple[Island, Island]]:
+        return [bridge for bridge, active in zip(self.bridges, self.active) if active]
+
+    def remove_edge(self, x: Island, y: Island):
+        """
+        Removes one bridge from x to y
+        """
+        target = self._ids[y]
+        for e in self._edges(self.out_offsets, self.out_index, x):
+            if self.targets[e] == target:
+                self.active[e] = 0
+                return
+        raise KeyError(f"No bridge from {x!r} to {y!r}")
+
+    def bridge_variables(self, variables: Dict[int, Tuple[Island, Island]]) -> List[int]:
+        """
+        The variable of each bridge, indexed by the number of the bridge, 0 for bridges without a variable
+        """
+        numbers = {bridge: e for e, bridge in enumerate(self.bridges)}
+        index = [0] * len(self.bridges)
+        for variable, bridge in variables.items():
+            index[numbers[bridge]] = variable
+        return index
+
+    def select(self, model: List[int], variables: Dict[int, Tuple[Island, Island]]):
+        """
+        Keeps only the bridges whose variable is true in the model. The model is indexed like the models
+        of pysat (model[v - 1] is v or -v), so only the variables of the bridges are read and the auxiliary
+        variables are never visited. Bridges without a variable are not part of the cnf and are kept.
+        Bridges removed by an earlier model come back, so one graph can decode model after model.
+        """
+        self.active = bytearray(
+            v == 0 or model[v - 1] > 0 for v in self.bridge_variables(variables)
+        )
+
+    def bridge_counts(self) -> Tuple[List[int], List[int], List[int]]:
+        """
+        The pairs of islands that are connected by bridges, as the numbers of both islands (the lower one first)
+        and the number of bridges between them, ordered by the pair. Both directions of a bridge count
+        for the same pair.
+        """
+        n = len(self.islands)
+        # one integer key per pair, lower * n + higher
+        counts = Counter(
+            x * n + y if x < y else y * n + x
+            for x, y, active in zip(self.sources, self.targets, self.active)
+            if active
+        )
+        keys = sorted(counts)
+        return [key // n for key in keys], [key % n for key in keys], [counts[key] for key in keys]
+
+    def to_networkx(self) -> "nx.MultiDiGraph":
+        """
+        The graph as networkx graph with the position and number of every island, for plotting
+        """
+        import networkx as nx
+
+        g = nx.MultiDiGraph()
+        for island in self.islands:
+            g.add_node(island, pos=(island.y, -island.x), label=island.number_of_bridges)
+        g.add_edges_from(self.edges())
+        return g
@@ -1,69 +1,559 @@
 import os
-from typing import List
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 import argparse
+import cProfile
+import json
 from pathlib import Path
 
-import networkx as nx
-from matplotlib import pyplot as plt
-from pysat.solvers import MinisatGH
-from pysat.formula import CNF
+from pysat.solvers import (
+    Cadical103,
+    Cadical153,
+    Gluecard4,
+    Glucose3,
+    Glucose4,
+    Glucose42,
+    Lingeling,
+    MapleChrono,
+    MapleCM,
+    Maplesat,
+    Mergesat3,
+    Minicard,
+    Minisat22,
+    MinisatGH,
+)
 
-from boolean import to_solver_string_iterative
-from encoder import Encoder
-from reader import read_puzzle_from_string, to_graph
+from boolean import count_nodes, iter_solver_clauses
+from encoder import CARD_ENCODINGS, ArenaEncoder, DirectEncoder, Encoder, UndirectedEncoder
+from reader import Island, read_puzzle_from_string, to_graph
+import connectivity
+import deduction
+from cache import SolutionCache, default_cache_directory
+from simplify import Simplifier
 import tseytin
 
 
-def plot_graph(graph: nx.Graph):
-    pos = nx.get_node_attributes(graph, "pos")
-    labels = nx.get_node_attributes(graph, "label")
-    nx.draw(graph, pos=pos, with_labels=True, labels=labels)
+# SAT solvers of pysat that can be selected
+SOLVERS = {
+    "minisatgh": MinisatGH,
+    "minisat22": Minisat22,
+    "minicard": Minicard,
+    "glucose3": Glucose3,
+    "glucose4": Glucose4,
+    "glucose42": Glucose42,
+    "gluecard4": Gluecard4,
+    "cadical103": Cadical103,
+    "cadical153": Cadical153,
+    "lingeling": Lingeling,
+    "maplechrono": MapleChrono,
+    "maplecm": MapleCM,
+    "maplesat": Maplesat,
+    "mergesat3": Mergesat3,
+}
+
+
+def plot_graph(graph):
+    # only imported for plotting, solving works without matplotlib and networkx
+    try:
+        import networkx as nx
+        from matplotlib import pyplot as plt
+    except ImportError as error:
+        print(f"Cannot plot the graph, {error}", file=sys.stderr)
+        return graph
+
+    g = graph.to_networkx()
+    pos = nx.get_node_attributes(g, "pos")
+    labels = nx.get_node_attributes(g, "label")
+    nx.draw(g, pos=pos, with_labels=True, labels=labels)
     plt.show()
 
 
-def map_back(result: List[int], solver_mapping, islands_mapping, graph):
-    for variable in result:
-        if variable > 0:
-            # If the variable is positive, we keep the bridge because it is part of the solution
-            continue
-        variable = abs(variable)
-        bridge = solver_mapping.get(str(variable))
-        if bridge[0].isalpha():
-            # If the bridge is not a number, it is an auxiliary variable and we can ignore it
-            continue
-        # remove bridge from graph because it is not part of the solution
-        x, y = islands_mapping.get(bridge)
-        graph.remove_edge(x, y)
+def map_back(result: List[int], variables: Dict[int, Tuple[Island, Island]], graph):
+    # only the bridges whose variable is true stay in the graph, the auxiliary variables are never looked at
+    graph.select(result, variables)
+
+
+def solve_connected(
+    solver,
+    variables: Dict[int, Tuple[Island, Island]],
+    islands: List[Island],
+    verbose: bool = True,
+    fixed: List[Tuple[Island, Island, int]] = (),
+    stats: Dict | None = None,
+    assumptions: List[int] = (),
+    extend: Callable[[List[int]], List[int]] | None = None,
+) -> List[int] | None:
+    """
+    Solves until the bridges of the model connect all islands. Every time they do not,
+    a cut clause for each component is added and the same solver is asked again.
+    The cuts hold for every connected solution, so they can stay in the solver.
+    extend turns the models of the solver into models of the original cnf, if it was simplified.
+    """
+    start = time.perf_counter()
+    iterations = 0
+    model = None
+    while True:
+        iterations += 1
+        if not solver.solve(assumptions=assumptions):
+            model = None
+            break
+        model = solver.get_model()
+        if extend is not None:
+            model = extend(model)
+        cuts = connectivity.cut_clauses(model, variables, islands, fixed)
+        if not cuts:
+            break
+        solver.append_formula(cuts)
+    if stats is not None:
+        stats["connectivity_iterations"] = iterations
+    if verbose:
+        print(
+            f"connectivity: {iterations} iterations, {time.perf_counter() - start:.3f} seconds"
+        )
+    return model
+
+
+def _stage(timings: Dict[str, float] | None, name: str, start: float) -> float:
+    """
+    Adds the time since start to the stage and returns the start of the next stage
+    """
+    now = time.perf_counter()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + now - start
+    return now
+
+
+def _counted(clauses: Iterable[List[int]], stats: Dict) -> Iterator[List[int]]:
+    """
+    Passes the clauses through and counts them in stats
+    """
+    stats["clauses"] = 0
+    for clause in clauses:
+        stats["clauses"] += 1
+        yield clause
+
+
+def solution_bridges(graph) -> List[Tuple[Island, Island, int]]:
+    """
+    Counts the edges left in a solved graph, one entry with 1 or 2 bridges per pair of islands.
+    The islands are numbered in row-major order, so the first island of a pair is the upper or left one.
+    """
+    islands = graph.islands
+    return [
+        (islands[x], islands[y], count)
+        for x, y, count in zip(*graph.bridge_counts())
+    ]
+
+
+def solution_to_list(graph) -> List[List[int]]:
+    """
+    The solution as [row, column, row, column, bridges] entries
+    """
+    return [[x.x, x.y, y.x, y.y, count] for x, y, count in solution_bridges(graph)]
+
+
+def graph_from_solution(islands: List[Island], solution: List[List[int]]):
+    """
+    Builds the graph of a solved puzzle from the entries of solution_to_list
+    """
+    positions = {(island.x, island.y): island for island in islands}
+    bridges = []
+    for r1, c1, r2, c2, count in solution:
+        bridges.extend([(positions[(r1, c1)], positions[(r2, c2)])] * count)
+    return to_graph(islands, bridges)
+
+
+def encode_clauses(
+    graph,
+    bridges: List[Tuple[Island, Island]],
+    encoding: str,
+    card_encoding: str,
+    polarity: bool,
+    verbose: bool = True,
+    timings: Dict[str, float] | None = None,
+    stats: Dict | None = None,
+) -> Tuple[Iterable[List[int]], Dict[int, Tuple[Island, Island]]]:
+    """
+    Encodes the graph and returns the clauses and the variable of each bridge.
+    The literals of the ast encodings are numbered while the clauses are yielded,
+    so their variables are only complete once all clauses are consumed.
+    """
+    start = time.perf_counter()
+    if encoding in ("direct", "undirected"):
+        # encode the graph straight to integer clauses
+        integer_encoder = UndirectedEncoder if encoding == "undirected" else DirectEncoder
+        encoder = integer_encoder(card_encoding)
+        clauses, variables = encoder.encode(graph, bridges)
+        _stage(timings, "encode", start)
+        if verbose:
+            print(f"{card_encoding}: {encoder.pool.top} variables, {len(clauses)} clauses")
+        if stats is not None:
+            _variable_stats(stats, encoder.pool.top, variables)
+    else:
+        # encode the graph to a boolean expression, either as node objects or in an arena
+        encoder = ArenaEncoder() if encoding == "arena" else Encoder()
+        expression, islands_mapping = encoder.encode(graph, bridges)
+        start = _stage(timings, "encode", start)
+        if stats is not None:
+            stats["ast_nodes"] = count_nodes(expression)
+            start = time.perf_counter()
+        # transform the expression to cnf
+        expression = tseytin.transform(expression, polarity=polarity)
+        _stage(timings, "transform", start)
+        literal_map = {}
+        variables = {}
+
+        def numbered() -> Iterator[List[int]]:
+            # number the literals and yield the clauses one at a time
+            yield from iter_solver_clauses(expression, literal_map)
+            # the literals are numbered, so we know the variable of every bridge
+            variables.update(
+                (literal_map[name], edge)
+                for name, edge in islands_mapping.items()
+                if name in literal_map
+            )
+            if stats is not None:
+                _variable_stats(stats, len(literal_map), variables)
+
+        clauses = numbered()
+    if stats is not None:
+        clauses = _counted(clauses, stats)
+    return clauses, variables
+
+
+def _variable_stats(stats: Dict, number_of_variables: int, variables: Dict):
+    # everything that is not a bridge is an auxiliary variable of the transformation
+    # or the cardinality encoding
+    stats["variables"] = number_of_variables
+    stats["bridge_variables"] = len(variables)
+    stats["aux_variables"] = number_of_variables - len(variables)
+
+
+def simplify_clauses(
+    clauses: Iterable[List[int]],
+    variables: Dict[int, Tuple[Island, Island]],
+    verbose: bool = True,
+    timings: Dict[str, float] | None = None,
+    stats: Dict | None = None,
+) -> Tuple[List[List[int]], Simplifier]:
+    """
+    Simplifies the clauses with the bridges frozen, returns them and the simplifier that extends the models
+    """
+    # the variables of the ast encodings are only complete once all clauses are numbered
+    clauses = list(clauses)
+    start = time.perf_counter()
+    simplifier = Simplifier(variables)
+    clauses = simplifier.simplify(clauses)
+    _stage(timings, "simplify", start)
+    if verbose:
+        print(
+            f"simplify: {simplifier.stats['clauses_before']} -> {simplifier.stats['clauses_after']} clauses, "
+            f"{simplifier.stats['variables_before']} -> {simplifier.stats['variables_after']} variables"
+        )
+    if stats is not None:
+        stats["simplify"] = simplifier.stats
+    return clauses, simplifier
+
+
+def _solve_cnf(
+    graph,
+    bridges: List[Tuple[Island, Island]],
+    nodes: List[Island],
+    fixed: List[Tuple[Island, Island, int]],
+    cnf_to_file: bool,
+    cnf_path: Path,
+    encoding: str,
+    card_encoding: str,
+    polarity: bool,
+    solver_name: str,
+    connected: bool,
+    verbose: bool,
+    timings: Dict[str, float] | None,
+    stats: Dict | None,
+    simplify: bool = False,
+    puzzle: str | None = None,
+) -> Tuple[List[int] | None, Dict[int, Tuple[Island, Island]]]:
+    """
+    Encodes the graph, solves it and returns the model (or None) and the variable of each bridge.
+    With simplify, the solver gets the simplified clauses and the model is extended to the original ones.
+    The cnf is written with the mapping of the bridges to the islands of the puzzle, see artifact.stream_cnf.
+    """
+    clauses, variables = encode_clauses(
+        graph, bridges, encoding, card_encoding, polarity, verbose, timings, stats
+    )
+    extend = None
+    if simplify:
+        clauses, simplifier = simplify_clauses(clauses, variables, verbose, timings, stats)
+        extend = simplifier.extend
+    start = time.perf_counter()
+    solver = SOLVERS[solver_name]()
+    # hand the clauses to the SAT solver, while streaming them to the file if needed
+    if cnf_to_file:
+        from artifact import stream_cnf
+
+        solver.append_formula(stream_cnf(clauses, cnf_path, puzzle, variables, fixed))
+    else:
+        solver.append_formula(clauses)
+    start = _stage(timings, "load", start)
+    if connected:
+        model = solve_connected(solver, variables, nodes, verbose, fixed, stats, extend=extend)
+    else:
+        model = solver.get_model() if solver.solve() else None
+        if model is not None and extend is not None:
+            model = extend(model)
+    if stats is not None:
+        # restarts, conflicts, decisions and propagations
+        stats["solver"] = solver.accum_stats() or {}
+    solver.delete()
+    _stage(timings, "solve", start)
+    return model, variables
 
 
 def solve(
-    puzzle: str, plot: bool = False, cnf_to_file: bool = False, cnf_path: Path = None
+    puzzle: str,
+    plot: bool = False,
+    cnf_to_file: bool = False,
+    cnf_path: Path = None,
+    encoding: str = "tseytin",
+    card_encoding: str = "naive",
+    polarity: bool = False,
+    solver_name: str = "minisatgh",
+    connected: bool = True,
+    deduce: bool = False,
+    verbose: bool = True,
+    timings: Dict[str, float] | None = None,
+    cache: SolutionCache | None = None,
+    stats: Dict | None = None,
+    portfolio: List[Tuple[str, str]] | None = None,
+    simplify: bool = False,
 ):
+    """
+    Solves the puzzle and returns the graph with the bridges of the solution, or None.
+    If timings is given, the seconds spent in each stage are added to it.
+    If stats is given, the size of the problem and the statistics of the solver are stored in it.
+    If a cache is given, known puzzles (or rotations and reflections of them) are not solved again.
+    Only solutions with connectivity are cached, and the cache is skipped when the cnf is written.
+    With deduce, bridges forced by local rules are fixed first and only the rest is encoded.
+    With a portfolio of (solver, encoding), all of them race in parallel and the first answer is taken,
+    encoding and solver_name are not used then.
+    With simplify, the cnf is simplified before solving (see simplify.Simplifier).
+    """
+    start = time.perf_counter()
+    if not connected or cnf_to_file:
+        cache = None
+    if cache is not None:
+        found, solution = cache.get(puzzle)
+        start = _stage(timings, "cache", start)
+        if stats is not None:
+            stats["cache"] = "hit" if found else "miss"
+        if found:
+            if verbose:
+                print(f"cache: hit ({cache.hits} hits, {cache.misses} misses)")
+            if solution is None:
+                if verbose:
+                    print("No solution found")
+                return None
+            graph = graph_from_solution(read_puzzle_from_string(puzzle)[0], solution)
+            if plot:
+                plot_graph(graph)
+            return graph
     # transform to islands and bridges
     islands, bridges = read_puzzle_from_string(puzzle)
+    start = _stage(timings, "parse", start)
+    if stats is not None:
+        stats["islands"] = len(islands)
+        stats["bridges"] = len(bridges)
+    residual_islands, residual_bridges = islands, bridges
+    nodes = None
+    fixed = []
+    unsatisfiable = False
+    if deduce:
+        # fix the bridges that are forced, only the rest is left for the solver
+        deduced = deduction.deduce(islands, bridges, connected)
+        residual_islands, residual_bridges = deduced.islands, deduced.bridges
+        nodes, fixed = deduced.nodes, deduced.fixed
+        unsatisfiable = deduced.unsatisfiable
+        start = _stage(timings, "deduce", start)
+        if stats is not None:
+            stats["eliminated"] = deduced.eliminated
+            stats["fixed_bridges"] = len(fixed)
+        if verbose:
+            print(
+                f"deduction: {deduced.eliminated} of {len(bridges)} bridge variables eliminated, "
+                f"{len(fixed)} bridges fixed"
+            )
     # make a graph from the islands and bridges
-    graph = to_graph(islands, bridges)
-    # encode the graph to a boolean expression
-    expression, islands_mapping = Encoder().encode(graph, bridges)
-    # transform the expression to cnf
-    expression = tseytin.transform(expression)
-    # transform the cnf to a string that can be used by a SAT solver
-    flat, mapping = to_solver_string_iterative(expression)
+    graph = to_graph(residual_islands, residual_bridges)
+    if nodes is None:
+        nodes = list(graph.nodes)
+    start = _stage(timings, "graph", start)
+    if unsatisfiable or deduce and not residual_bridges:
+        if cnf_to_file:
+            # the cnf is written even without the solver: an empty clause if the deduction found
+            # a contradiction, no clauses but the fixed bridges if it fixed every bridge
+            _write_cnf(cnf_path, [[]] if unsatisfiable else [], puzzle, {}, fixed)
+    if unsatisfiable:
+        model = None
+    elif deduce and not residual_bridges:
+        # every bridge is fixed, so only the connectivity is left to check
+        model = [] if not connected or not connectivity.cut_clauses([], {}, nodes, fixed) else None
+        if verbose:
+            print("deduction: solved without the SAT solver")
+    elif portfolio:
+        from portfolio import solve_portfolio
 
-    if cnf_to_file:
-        with open(cnf_path, "w") as file:
-            file.write(flat)
-    # solve the cnf with a SAT solver
-    solver = MinisatGH()
-    cnf = CNF(from_string=flat)
-    solver.append_formula(cnf)
-    if not solver.solve():
-        print("No solution found")
-        return
+        model, variables, winner = solve_portfolio(
+            graph,
+            residual_bridges,
+            nodes,
+            fixed,
+            portfolio,
+            card_encoding,
+            polarity,
+            connected,
+            verbose,
+            timings,
+            cnf_path if cnf_to_file else None,
+            simplify,
+            puzzle,
+        )
+        if stats is not None:
+            stats["portfolio_winner"] = winner
+    else:
+        model, variables = _solve_cnf(
+            graph,
+            residual_bridges,
+            nodes,
+            fixed,
+            cnf_to_file,
+            cnf_path,
+            encoding,
+            card_encoding,
+            polarity,
+            solver_name,
+            connected,
+            verbose,
+            timings,
+            stats,
+            simplify,
+            puzzle,
+        )
+    start = time.perf_counter()
+    if model is None:
+        if cache is not None:
+            cache.put(puzzle, None)
+        if verbose:
+            print("No solution found")
+        return None
     # map the result back to the graph
-    map_back(solver.get_model(), mapping, islands_mapping, graph)
+    if residual_bridges:
+        map_back(model, variables, graph)
+    if deduce:
+        # the residual islands are copies, so the solution is moved to a graph of the original islands
+        solution = solution_to_list(graph) + [
+            [x.x, x.y, y.x, y.y, count] for x, y, count in fixed
+        ]
+        graph = graph_from_solution(islands, solution)
+    start = _stage(timings, "decode", start)
+    if cache is not None:
+        cache.put(puzzle, solution_to_list(graph))
+        _stage(timings, "cache", start)
+    if plot:
+        plot_graph(graph)
+    return graph
+
+
+def _write_cnf(
+    cnf_path: Path,
+    clauses: Iterable[List[int]],
+    puzzle: str,
+    variables: Dict[int, Tuple[Island, Island]],
+    fixed: List[Tuple[Island, Island, int]],
+):
+    """
+    Writes the clauses without handing them to a solver, see artifact.stream_cnf
+    """
+    from artifact import stream_cnf
+
+    for _ in stream_cnf(clauses, cnf_path, puzzle, variables, fixed):
+        pass
+
+
+def _padded(model: List[int], top: int) -> List[int]:
+    """
+    The model with every variable up to top, the solver only knows the variables that are left
+    in the clauses (a simplified cnf can lose bridges), the others are false
+    """
+    if len(model) >= top:
+        return model
+    return model + [-variable for variable in range(len(model) + 1, top + 1)]
+
+
+def solve_from_cnf(
+    cnf_path: Path,
+    puzzle: str | None = None,
+    plot: bool = False,
+    solver_name: str = "minisatgh",
+    connected: bool = True,
+    verbose: bool = True,
+    timings: Dict[str, float] | None = None,
+    stats: Dict | None = None,
+):
+    """
+    Solves a cnf written with cnf_to_file (or any DIMACS file) without encoding the puzzle again and
+    returns the status, the graph of the solution and the puzzle (rebuilt from the file if not given).
+    The islands, the variable of each bridge and the bridges fixed by the deduction come from the file,
+    the clauses go to the solver as they are.
+    If the puzzle is given, the cnf has to be written for it.
+    A file without the mapping of the bridges (e.g. from another tool) is only checked for satisfiability:
+    the status is "satisfiable" and there is no graph, nor a check of the connectivity.
+    A file written after the deduction fixed every bridge has no clauses, only the fixed bridges.
+    """
+    from artifact import load_cnf
+
+    start = time.perf_counter()
+    artifact = load_cnf(cnf_path)
+    if puzzle is not None and not artifact.matches(puzzle):
+        raise ValueError(f"{cnf_path} was written for a different puzzle")
+    islands, variables, fixed = artifact.islands, artifact.variables, artifact.fixed
+    if puzzle is None:
+        puzzle = artifact.puzzle()
+    start = _stage(timings, "parse", start)
+    if stats is not None:
+        stats["islands"] = len(islands)
+        stats["clauses"] = artifact.number_of_clauses
+        _variable_stats(stats, artifact.number_of_variables, variables)
+    solver = SOLVERS[solver_name]()
+    solver.append_formula(artifact.clauses())
+    start = _stage(timings, "load", start)
+    top = max(variables, default=0)
+    if connected and islands:
+        model = solve_connected(
+            solver, variables, islands, verbose, fixed, stats, extend=lambda m: _padded(m, top)
+        )
+    else:
+        model = _padded(solver.get_model(), top) if solver.solve() else None
+    if stats is not None:
+        stats["solver"] = solver.accum_stats() or {}
+    solver.delete()
+    start = _stage(timings, "solve", start)
+    if model is None:
+        if verbose:
+            print("No solution found")
+        return "unsatisfiable", None, puzzle
+    if not islands:
+        if verbose:
+            print(f"Satisfiable, {cnf_path} has no mapping of the bridges to decode the solution")
+        return "satisfiable", None, puzzle
+    graph = to_graph(islands, list(variables.values()))
+    map_back(model, variables, graph)
+    solution = solution_to_list(graph) + [[x.x, x.y, y.x, y.y, count] for x, y, count in fixed]
+    graph = graph_from_solution(islands, solution)
+    _stage(timings, "decode", start)
     if plot:
         plot_graph(graph)
+    return "solved", graph, puzzle
 
 
 def test():
@@ -81,32 +571,355 @@ def test():
             )
 
 
+def add_solve_arguments(parser: argparse.ArgumentParser):
+    """
+    Options of the solver pipeline, shared by all commands
+    """
+    parser.add_argument(
+        "--encoding",
+        choices=["tseytin", "arena", "direct", "undirected"],
+        default="tseytin",
+        help="Encode through the boolean ast (node objects or an arena) and tseytin, "
+        "or directly to integer clauses, with one variable per direction of a bridge "
+        "or one canonical pair of variables per pair of islands.",
+    )
+    parser.add_argument(
+        "--card-encoding",
+        choices=list(CARD_ENCODINGS),
+        default="naive",
+        help="Cardinality encoding for the bridges of an island "
+        "(direct and undirected encoding only).",
+    )
+    parser.add_argument(
+        "--polarity",
+        action="store_true",
+        help="Use the polarity-aware Plaisted-Greenbaum transformation with shared subexpressions "
+        "instead of the plain Tseytin transformation (tseytin and arena encoding only).",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=list(SOLVERS),
+        default="minisatgh",
+        help="SAT solver of pysat that solves the cnf.",
+    )
+    parser.add_argument(
+        "--no-connectivity",
+        action="store_true",
+        help="Do not require the bridges to connect all islands.",
+    )
+    parser.add_argument(
+        "--deduce",
+        action="store_true",
+        help="Fix the bridges forced by local rules before encoding, only the rest goes to the solver.",
+    )
+    parser.add_argument(
+        "--simplify",
+        action="store_true",
+        help="Simplify the cnf before solving: units, duplicates, tautologies, subsumption, "
+        "pure literals and elimination of auxiliary variables.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not look up or store solutions in the solution cache.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=str(default_cache_directory()),
+        help="Directory of the solution cache.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=64,
+        help="Size of the solution cache in MB, least recently used solutions are evicted.",
+    )
+
+
+def solve_options(args: argparse.Namespace) -> Dict:
+    """
+    Keyword arguments for solve from the options added by add_solve_arguments
+    """
+    return dict(
+        encoding=args.encoding,
+        card_encoding=args.card_encoding,
+        polarity=args.polarity,
+        solver_name=args.solver,
+        connected=not args.no_connectivity,
+        deduce=args.deduce,
+        simplify=args.simplify,
+    )
+
+
+def make_cache(args: argparse.Namespace) -> SolutionCache | None:
+    """
+    The solution cache from the options added by add_solve_arguments, None with --no-cache
+    """
+    if args.no_cache:
+        return None
+    return SolutionCache(args.cache_dir, int(args.cache_size * 1024 * 1024))
+
+
+def _flatten(stats: Dict, prefix: str = "") -> Iterator[Tuple[str, object]]:
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def report_stats(stats: Dict, stats_lines: bool, stats_json: str | None):
+    """
+    Writes the stats as key=value lines to stderr and/or as json document to a file ("-" for stdout)
+    """
+    if stats_lines:
+        for key, value in _flatten(stats):
+            print(f"{key}={value}", file=sys.stderr)
+    if stats_json == "-":
+        print(json.dumps(stats))
+    elif stats_json:
+        with open(stats_json, "w") as file:
+            json.dump(stats, file, indent=2)
+
+
+def _verbose(args: argparse.Namespace) -> bool:
+    """
+    Progress messages are only printed if stdout is not taken by the solution (--format)
+    or by the statistics (--stats-json -), so both stay machine-readable
+    """
+    return args.format is None and args.stats_json != "-"
+
+
+def _enumerate(
+    puzzle: str, args: argparse.Namespace, timings: Dict | None, stats: Dict | None
+) -> str:
+    """
+    Counts the solutions for --count-solutions or --check-unique, prints them and returns the status
+    """
+    from formats import print_solution
+    from solutions import enumerate_solutions
+
+    # two solutions are enough to know that a puzzle is not unique
+    limit = 2 if args.check_unique else args.count_solutions or None
+    found = 0
+    for solution in enumerate_solutions(
+        puzzle,
+        limit,
+        args.card_encoding,
+        args.solver,
+        not args.no_connectivity,
+        args.deduce,
+        _verbose(args),
+        timings,
+        stats,
+    ):
+        found += 1
+        if args.format is not None:
+            print_solution(puzzle, solution, args.format)
+    # the count goes to stderr when the solutions or the statistics are written to stdout
+    output = sys.stdout if _verbose(args) else sys.stderr
+    if args.check_unique:
+        status = {0: "unsatisfiable", 1: "unique"}.get(found, "ambiguous")
+        print(
+            {
+                "unsatisfiable": "No solution found",
+                "unique": "The solution is unique",
+                "ambiguous": "More than one solution",
+            }[status],
+            file=output,
+        )
+        return status
+    if found == limit:
+        print(f"At least {found} solutions, stopped after {limit}", file=output)
+    else:
+        print(f"{found} solution{'' if found == 1 else 's'}", file=output)
+    return "solved" if found else "unsatisfiable"
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Solve a puzzle.")
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        import batch
+
+        batch.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        import serve
+
+        serve.main(sys.argv[2:])
+        return
+    from formats import FORMATS, print_solution
+    from portfolio import DEFAULT_PORTFOLIO, parse_portfolio
+
+    parser = argparse.ArgumentParser(
+        description="Solve a puzzle.",
+        epilog="Use 'main.py batch --help' to solve many puzzles in parallel "
+        "and 'main.py serve --help' to keep a solver server running.",
+    )
     parser.add_argument(
         "puzzle_file", type=str, nargs="?", help="Path to the puzzle file."
     )
     parser.add_argument("--plot", action="store_true", help="Plot the graph.")
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        help="Write the solution to stdout as JSON, as ASCII grid or as bridge counts, "
+        "the progress messages are left out then.",
+    )
     parser.add_argument(
         "--cnf_to_file", action="store_true", help="Write the CNF to a file."
     )
-    parser.add_argument("--cnf_path", type=str, help="Path to the CNF file.")
+    parser.add_argument(
+        "--cnf_path",
+        type=str,
+        help="Path to the CNF file, written in the binary format if it ends with .hcnf, "
+        "otherwise as DIMACS.",
+    )
+    parser.add_argument(
+        "--from-cnf",
+        type=str,
+        metavar="CNF_FILE",
+        help="Solve a CNF written with --cnf_to_file (binary or DIMACS) without encoding the puzzle, "
+        "the puzzle file is optional then and is checked against the hash in the CNF.",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the time of each stage, the size of the problem and the solver statistics "
+        "as key=value lines to stderr.",
+    )
+    parser.add_argument(
+        "--stats-json",
+        type=str,
+        metavar="FILE",
+        help='Write the same statistics as JSON to this file, "-" for stdout.',
+    )
+    parser.add_argument(
+        "--portfolio",
+        type=parse_portfolio,
+        nargs="?",
+        const=DEFAULT_PORTFOLIO,
+        metavar="SOLVER:ENCODING,...",
+        help="Race several solver and encoding combinations in parallel processes and take the first answer, "
+        f"defaults to {','.join(f'{s}:{e}' for s, e in DEFAULT_PORTFOLIO)}.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="FILE",
+        help="Profile solving with cProfile and dump the result to this file (see pstats).",
+    )
+    enumeration = parser.add_mutually_exclusive_group()
+    enumeration.add_argument(
+        "--count-solutions",
+        type=int,
+        nargs="?",
+        const=0,
+        metavar="N",
+        help="Count the solutions on one incremental solver, stop after N solutions "
+        "(all without N). With --format, every solution is written.",
+    )
+    enumeration.add_argument(
+        "--check-unique",
+        action="store_true",
+        help="Check that the puzzle has exactly one solution, "
+        "exits with 1 if it has none or more than one.",
+    )
+    add_solve_arguments(parser)
     args = parser.parse_args()
+    if args.from_cnf is not None and (
+        args.count_solutions is not None or args.check_unique or args.portfolio or args.cnf_to_file
+    ):
+        parser.error("--from-cnf can not be combined with counting, a portfolio or writing a CNF")
+    if (args.count_solutions is not None or args.check_unique) and (
+        args.encoding not in (parser.get_default("encoding"), "undirected")
+        or args.polarity
+        or args.simplify
+        or args.cnf_to_file
+        or args.portfolio
+    ):
+        # the solutions are always counted with the undirected encoding, without simplification
+        parser.error(
+            "--count-solutions and --check-unique use the undirected encoding and can not be combined "
+            "with --encoding, --polarity, --simplify, --cnf_to_file or a portfolio"
+        )
 
-    if args.puzzle_file is None:
+    if args.puzzle_file is None and args.from_cnf is None:
         test()
     else:
-        puzzle_file = Path(args.puzzle_file)
-        with open(puzzle_file, "r") as f:
-            puzzle_str = f.read()
-        solve(
-            puzzle_str,
-            plot=args.plot,
-            cnf_to_file=args.cnf_to_file,
-            cnf_path=Path(args.cnf_path)
-            if args.cnf_path
-            else puzzle_file.with_suffix(".cnf"),
-        )
+        puzzle_file = Path(args.puzzle_file or args.from_cnf)
+        puzzle_str = None
+        if args.puzzle_file is not None:
+            with open(puzzle_file, "r") as f:
+                puzzle_str = f.read()
+        collect = args.stats or args.stats_json is not None
+        timings = {} if collect else None
+        stats = {} if collect else None
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        if args.from_cnf is not None:
+            try:
+                status, graph, puzzle_str = solve_from_cnf(
+                    Path(args.from_cnf),
+                    puzzle_str,
+                    args.plot,
+                    args.solver,
+                    not args.no_connectivity,
+                    _verbose(args),
+                    timings,
+                    stats,
+                )
+            except ValueError as error:
+                parser.error(str(error))
+            if args.format is not None:
+                print_solution(
+                    puzzle_str,
+                    None if graph is None else solution_to_list(graph),
+                    args.format,
+                    status,
+                )
+        elif args.count_solutions is not None or args.check_unique:
+            status = _enumerate(puzzle_str, args, timings, stats)
+        else:
+            graph = solve(
+                puzzle_str,
+                plot=args.plot,
+                cnf_to_file=args.cnf_to_file,
+                cnf_path=Path(args.cnf_path)
+                if args.cnf_path
+                else puzzle_file.with_suffix(".cnf"),
+                cache=make_cache(args),
+                timings=timings,
+                stats=stats,
+                portfolio=args.portfolio,
+                verbose=_verbose(args),
+                **solve_options(args),
+            )
+            status = "unsatisfiable" if graph is None else "solved"
+            if args.format is not None:
+                print_solution(
+                    puzzle_str, None if graph is None else solution_to_list(graph), args.format
+                )
+        total = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if collect:
+            timings["total"] = total
+            report_stats(
+                {
+                    "puzzle": str(puzzle_file),
+                    "status": status,
+                    "timings": {stage: round(t, 6) for stage, t in timings.items()},
+                    **stats,
+                },
+                args.stats,
+                args.stats_json,
+            )
+        if args.check_unique and status != "unique":
+            sys.exit(1)
 
 
 if __name__ == "__main__":
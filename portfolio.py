@@ -0,0 +1,147 @@
+import argparse
+import time
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from main import SOLVERS, _stage, encode_clauses, simplify_clauses, solve_connected
+from reader import Island
+
+ENCODINGS = ["tseytin", "arena", "direct", "undirected"]
+
+# Combinations of solver and encoding that are run by --portfolio without a list.
+# The first member to finish answers, so every encoding has to accept exactly the same solutions.
+DEFAULT_PORTFOLIO = [
+    ("minisatgh", "direct"),
+    ("cadical153", "direct"),
+    ("glucose4", "direct"),
+    ("maplechrono", "arena"),
+]
+
+
+def parse_portfolio(text: str) -> List[Tuple[str, str]]:
+    """
+    "solver:encoding,solver:encoding,..." as list of (solver, encoding),
+    the encoding defaults to direct
+    """
+    configs = []
+    for entry in text.split(","):
+        solver_name, _, encoding = entry.strip().partition(":")
+        encoding = encoding or "direct"
+        if solver_name not in SOLVERS:
+            raise argparse.ArgumentTypeError(f"unknown solver {solver_name!r}")
+        if encoding not in ENCODINGS:
+            raise argparse.ArgumentTypeError(f"unknown encoding {encoding!r}")
+        configs.append((solver_name, encoding))
+    return configs
+
+
+def _member(
+    conn: Connection,
+    solver_name: str,
+    clauses: List[List[int]],
+    variables: Dict[int, Tuple[Island, Island]],
+    extend: Callable[[List[int]], List[int]] | None,
+    nodes: List[Island],
+    fixed: List[Tuple[Island, Island, int]],
+    connected: bool,
+):
+    try:
+        solver = SOLVERS[solver_name]()
+        solver.append_formula(clauses)
+        if connected:
+            model = solve_connected(solver, variables, nodes, False, fixed, extend=extend)
+        else:
+            model = solver.get_model() if solver.solve() else None
+            if model is not None and extend is not None:
+                model = extend(model)
+        solver.delete()
+        # the whole model is sent back, the bridges are decoded by the index of their variable
+        conn.send(("done", model))
+    except Exception as error:
+        conn.send(("error", f"{type(error).__name__}: {error}"))
+
+
+def solve_portfolio(
+    graph,
+    bridges: List[Tuple[Island, Island]],
+    nodes: List[Island],
+    fixed: List[Tuple[Island, Island, int]],
+    configs: List[Tuple[str, str]],
+    card_encoding: str,
+    polarity: bool,
+    connected: bool,
+    verbose: bool = True,
+    timings: Dict[str, float] | None = None,
+    cnf_path: Path | None = None,
+    simplify: bool = False,
+    puzzle: str | None = None,
+) -> Tuple[List[int] | None, Dict[int, Tuple[Island, Island]], str]:
+    """
+    Runs every (solver, encoding) of configs in its own process and returns the model (or None)
+    of the first one that finishes, the variable of each bridge in its encoding and its name.
+    The others are killed, so even solvers that cannot be interrupted are stopped right away.
+    Every encoding is only encoded once, all solvers using it get the same clauses.
+    If cnf_path is given, the cnf of the first encoding is written to it (see artifact.stream_cnf).
+    With simplify, every encoding is simplified once and the members extend their models.
+    """
+    encoded = {}
+    for _, encoding in configs:
+        if encoding in encoded:
+            continue
+        clauses, variables = encode_clauses(
+            graph, bridges, encoding, card_encoding, polarity, False, timings
+        )
+        extend = None
+        if simplify:
+            clauses, simplifier = simplify_clauses(clauses, variables, False, timings)
+            extend = simplifier.extend
+        start = time.perf_counter()
+        if cnf_path is not None and not encoded:
+            from artifact import stream_cnf
+
+            clauses = list(stream_cnf(clauses, cnf_path, puzzle, variables, fixed))
+        else:
+            clauses = list(clauses)
+        _stage(timings, "load", start)
+        encoded[encoding] = (clauses, variables, extend)
+
+    start = time.perf_counter()
+    # connection -> (name of the configuration, its process)
+    members: Dict[Connection, Tuple[str, Process]] = {}
+    for solver_name, encoding in configs:
+        conn, child_conn = Pipe()
+        process = Process(
+            target=_member,
+            args=(child_conn, solver_name, *encoded[encoding], nodes, fixed, connected),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        members[conn] = (f"{solver_name}:{encoding}", process)
+
+    pending = dict(members)
+    errors = []
+    try:
+        while pending:
+            for conn in wait(list(pending)):
+                name, _ = pending.pop(conn)
+                try:
+                    status, result = conn.recv()
+                except EOFError:
+                    status, result = "error", "process died"
+                if status == "error":
+                    errors.append(f"{name}: {result}")
+                    continue
+                _stage(timings, "solve", start)
+                if verbose:
+                    print(f"portfolio: {name} won after {time.perf_counter() - start:.3f} seconds")
+                return result, encoded[name.split(":")[1]][1], name
+        raise RuntimeError(f"Every solver of the portfolio failed, {'; '.join(errors)}")
+    finally:
+        for conn, (_, process) in members.items():
+            if conn in pending:
+                process.kill()
+            process.join()
+            conn.close()
@@ -1,10 +1,16 @@
-from typing import Tuple, List
+import io
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
 
-import networkx as nx
-import matplotlib.pyplot as plt
+# networkx and matplotlib take long to import, they are only imported when a graph is drawn
+if TYPE_CHECKING:
+    from graph import BridgeGraph
 
 
 class Island:
+    # Islands are only created for the cells with a number, slots keep them small
+    __slots__ = ("x", "y", "number_of_bridges", "name")
+
     def __init__(self, x, y, number_of_bridges, name):
         self.x = x
         self.y = y
@@ -18,82 +24,71 @@ class Island:
         return self.name
 
 
-# Convert puzzle text to array with Island
-def _find_islands(puzzle_lines):
+# Cells that are not water
+_ISLAND = re.compile(r"[^.\s]")
+
+
+def read_puzzle(
+    lines: Iterable[str],
+) -> Tuple[List[Island], List[Tuple[Island, Island]]]:
+    """
+    Reads a puzzle from its lines in one pass. The grid is stored sparsely, only the islands are kept,
+    in row-major order. While going through the rows, the last island of the current row and the last
+    island of every column are the neighbours to the left and above, so the next island to the right
+    and below is known without searching cell by cell.
+    """
+    lines = iter(lines)
+    height, _ = map(int, next(lines).split())
     islands = []
-    counter = 0
-    for r, col in enumerate(puzzle_lines):
-        my_col = []
-        for c, ele in enumerate(col.strip()):
-            if ele == ".":
-                my_col.append(None)
-            else:
-                counter += 1
-                number_of_bridges = int(ele)
-                my_col.append(Island(r, c, number_of_bridges, str(counter)))
-        islands.append(my_col)
-    return islands
-
-
-# Find all possible bridges
-def _find_bridge(target_island, islands, puzzle_size):
+    # index of the neighbour in each direction, the same order as the reader always used
+    down, up, right, left = [], [], [], []
+    last_in_column: Dict[int, int] = {}
+    for r, line in zip(range(height), lines):
+        previous = None
+        for match in _ISLAND.finditer(line):
+            c = match.start()
+            index = len(islands)
+            islands.append(Island(r, c, int(match.group()), str(index + 1)))
+            down.append(None)
+            right.append(None)
+            above = last_in_column.get(c)
+            up.append(above)
+            if above is not None:
+                down[above] = index
+            left.append(previous)
+            if previous is not None:
+                right[previous] = index
+            last_in_column[c] = index
+            previous = index
     bridges = []
-    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-    for direction in directions:
-        searching_row, searching_col = (
-            target_island.x + direction[0],
-            target_island.y + direction[1],
-        )
-        while (
-            0 <= searching_row < puzzle_size[0] and 0 <= searching_col < puzzle_size[1]
-        ):
-            if islands[searching_row][searching_col] is not None:
-                bridges.append((target_island, islands[searching_row][searching_col]))
-                break
-            else:
-                searching_row += direction[0]
-                searching_col += direction[1]
-    return bridges
+    for index, island in enumerate(islands):
+        for neighbours in (down, up, right, left):
+            if neighbours[index] is not None:
+                bridges.append((island, islands[neighbours[index]]))
+    return islands, bridges
 
 
 def read_puzzle_from_string(
     puzzle_str: str,
-) -> Tuple[List[List[Island]], List[Tuple[Island, Island]]]:
-    lines = puzzle_str.splitlines()
-    puzzle_size = tuple(map(int, lines.pop(0).split()))
-    islands = _find_islands(lines)
-    bridges = []
-    for rows in islands:
-        for island in rows:
-            if island is not None:
-                bridges.extend(_find_bridge(island, islands, puzzle_size))
-    return islands, bridges
+) -> Tuple[List[Island], List[Tuple[Island, Island]]]:
+    return read_puzzle(io.StringIO(puzzle_str))
 
 
 def to_graph(
-    islands: List[List[Island]], bridges: List[Tuple[Island, Island]]
-) -> nx.MultiDiGraph:
-    g = nx.MultiDiGraph()
-    for rows in islands:
-        for island in rows:
-            if island is not None:
-                g.add_node(
-                    island, pos=(island.y, -island.x), label=island.number_of_bridges
-                )
-    g.add_edges_from(bridges)
-    return g
+    islands: List[Island], bridges: List[Tuple[Island, Island]]
+) -> "BridgeGraph":
+    # graph imports this module, so it is imported when the first graph is built
+    from graph import BridgeGraph
+
+    return BridgeGraph(islands, bridges)
 
 
 # Draw the puzzle as graph
-def plot_puzzle(islands: List[List[Island]], bridges: List[Tuple[Island, Island]]):
-    g = nx.MultiDiGraph()
-    for rows in islands:
-        for island in rows:
-            if island is not None:
-                g.add_node(
-                    island, pos=(island.y, -island.x), label=island.number_of_bridges
-                )
-    g.add_edges_from(bridges)
+def plot_puzzle(islands: List[Island], bridges: List[Tuple[Island, Island]]):
+    import networkx as nx
+    import matplotlib.pyplot as plt
+
+    g = to_graph(islands, bridges).to_networkx()
     pos = nx.get_node_attributes(g, "pos")
     labels = nx.get_node_attributes(g, "label")
     nx.draw(g, pos=pos, with_labels=True, labels=labels)
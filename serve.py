@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import signal
+import sys
+import time
+from multiprocessing.connection import Connection
+from typing import Dict, List
+
+from batch import SolverPool
+from formats import FORMATS
+from main import add_solve_arguments, make_cache, solve_options
+
+# Longest request line, a 1000x1000 puzzle is about 1 MB
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class AsyncSolverPool(SolverPool):
+    """
+    SolverPool for asyncio: solve waits for an idle worker and for its answer without blocking
+    the event loop, so many requests can wait at the same time. A worker running past the timeout
+    is killed and replaced like in SolverPool.imap.
+    """
+
+    def start(self):
+        self._idle: asyncio.Queue[Connection] = asyncio.Queue()
+        for _ in range(self.workers):
+            self._idle.put_nowait(self._start())
+
+    def close(self):
+        while not self._idle.empty():
+            # a worker that is already gone, e.g. after ctrl-c reached the whole process group, is killed
+            self._stop(self._idle.get_nowait())
+        # the workers that are still busy
+        for conn in list(self._processes):
+            self._stop(conn, kill=True)
+
+    async def solve(self, name: str, puzzle: str, timeout: float | None = None) -> Dict:
+        timeout = self.timeout if timeout is None else timeout
+        conn = await self._idle.get()
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(conn.fileno(), lambda: ready.done() or ready.set_result(None))
+        start = time.perf_counter()
+        try:
+            conn.send((name, puzzle))
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            loop.remove_reader(conn.fileno())
+            self._stop(conn, kill=True)
+            self._idle.put_nowait(self._start())
+            return {
+                "puzzle": name,
+                "status": "timeout",
+                "solution": None,
+                "timings": {"total": round(time.perf_counter() - start, 6)},
+            }
+        except BaseException:
+            # e.g. the server shuts down, the worker is in an unknown state
+            loop.remove_reader(conn.fileno())
+            self._stop(conn, kill=True)
+            raise
+        loop.remove_reader(conn.fileno())
+        try:
+            record = conn.recv()
+        except EOFError:
+            # the worker died, e.g. out of memory
+            self._stop(conn, kill=True)
+            self._idle.put_nowait(self._start())
+            return {
+                "puzzle": name,
+                "status": "error",
+                "error": "worker died",
+                "timings": {"total": round(time.perf_counter() - start, 6)},
+            }
+        self._idle.put_nowait(conn)
+        return record
+
+
+async def _answer(pool: AsyncSolverPool, line: bytes, number: int) -> Dict:
+    """
+    Solves one request, {"puzzle": "...", "id": ..., "timeout": seconds}, only the puzzle is required
+    """
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict) or not isinstance(request.get("puzzle"), str):
+            raise ValueError('expected an object with the puzzle as "puzzle"')
+        timeout = request.get("timeout")
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            raise ValueError('"timeout" has to be a number of seconds')
+    except ValueError as error:
+        return {"id": None, "status": "error", "error": f"invalid request, {error}"}
+    name = str(request.get("id", f"request:{number}"))
+    record = await pool.solve(name, request["puzzle"], timeout)
+    return {"id": request.get("id"), **record}
+
+
+async def _handle(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    pool: AsyncSolverPool,
+    pending: asyncio.Semaphore,
+):
+    """
+    Reads one request per line and answers each with one line as soon as it is solved,
+    so the answers can come in another order than the requests. A request is only read once
+    there is room for it, so clients sending more than the server can take are slowed down
+    by the socket instead of filling the memory of the server.
+    """
+    lock = asyncio.Lock()
+    tasks = set()
+    number = 0
+
+    async def answer(line: bytes, number: int):
+        try:
+            record = await _answer(pool, line, number)
+        finally:
+            pending.release()
+        async with lock:
+            writer.write((json.dumps(record) + "\n").encode())
+            await writer.drain()
+
+    try:
+        while True:
+            await pending.acquire()
+            try:
+                line = await reader.readline()
+            except (ValueError, ConnectionError) as error:
+                # ValueError if the line is longer than MAX_REQUEST_BYTES
+                pending.release()
+                writer.write(
+                    (json.dumps({"id": None, "status": "error", "error": str(error)}) + "\n").encode()
+                )
+                break
+            if not line.strip():
+                pending.release()
+                if not line:
+                    break
+                continue
+            number += 1
+            task = asyncio.create_task(answer(line, number))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        writer.close()
+
+
+async def serve(
+    pool: AsyncSolverPool,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: str | None = None,
+    max_pending: int = 64,
+):
+    """
+    Serves until SIGINT or SIGTERM, on the unix socket if socket_path is given, otherwise on host and port
+    """
+    pool.start()
+    pending = asyncio.Semaphore(max_pending)
+    handler = functools.partial(_handle, pool=pool, pending=pending)
+    if socket_path:
+        server = await asyncio.start_unix_server(
+            handler, path=socket_path, limit=MAX_REQUEST_BYTES
+        )
+        address = socket_path
+    else:
+        server = await asyncio.start_server(handler, host, port, limit=MAX_REQUEST_BYTES)
+        address = f"{host}:{port}"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    print(f"serving on {address} with {pool.workers} workers", file=sys.stderr)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        try:
+            pool.close()
+        finally:
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="main.py serve",
+        description="Keep solver processes running and solve puzzles sent as JSON lines over a socket.",
+    )
+    parser.add_argument("--socket", type=str, help="Listen on this unix socket instead of TCP.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes, defaults to the number of cores.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Seconds after which a puzzle is given up, requests can set their own.",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=64,
+        help="Requests that are solved or wait for a worker at the same time, "
+        "further requests are not read until one of them is answered.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="json",
+        help="Format of the solutions: [row, column, row, column, bridges] entries (default), "
+        "ASCII grid or bridge counts.",
+    )
+    add_solve_arguments(parser)
+    args = parser.parse_args(argv)
+
+    # Workers are started by a fork server that is started before any connection is accepted,
+    # forked workers would inherit the sockets and keep connections open after they are closed
+    pool = AsyncSolverPool(
+        args.workers,
+        solve_options(args),
+        args.timeout,
+        make_cache(args),
+        "forkserver",
+        args.format,
+    )
+    asyncio.run(serve(pool, args.host, args.port, args.socket, args.max_pending))
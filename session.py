@@ -0,0 +1,110 @@
+import time
+from typing import Dict, List
+
+from encoder import UndirectedEncoder
+from main import SOLVERS, solution_to_list, solve_connected
+from reader import Island, read_puzzle_from_string, to_graph
+
+
+class Session:
+    """
+    A puzzle that is edited one clue at a time and solved after every edit, on one solver that is kept warm.
+    The bridges, the crossings and the connectivity cuts do not depend on the numbers of the islands,
+    they are encoded once. The number of every island is encoded under its own selector variable s,
+    every clause c of it is added as "c or not s", so it only holds while s is assumed.
+    Changing a clue retires the selector of the old number (it is set to false for good, so the solver
+    can drop its clauses) and adds the new number under a new selector. Solving assumes the current
+    selectors, everything the solver has learned about the bridges is kept between the edits.
+    The islands themselves can not be moved, added or removed, that needs a new session.
+    """
+
+    islands: List[Island]
+    connected: bool
+    # seconds of the last solve, from the assumptions to the decoded solution
+    last_seconds: float
+
+    def __init__(
+        self,
+        puzzle: str,
+        card_encoding: str = "naive",
+        solver_name: str = "minisatgh",
+        connected: bool = True,
+    ):
+        self.islands, bridges = read_puzzle_from_string(puzzle)
+        self.connected = connected
+        self.last_seconds = 0.0
+        self._positions = {(island.x, island.y): island for island in self.islands}
+        # the clues are encoded from all bridges, the solutions are decoded into a graph of their own
+        self._graph = to_graph(self.islands, bridges)
+        self._solution = to_graph(self.islands, bridges)
+        self._encoder = UndirectedEncoder(card_encoding)
+        self._variables = self._encoder.allocate(self._graph)
+        self._solver = SOLVERS[solver_name](
+            bootstrap_with=self._encoder.encode_bridges(self._variables, bridges)
+        )
+        # island -> its current selector, and back
+        self._selectors: Dict[Island, int] = {}
+        self._islands: Dict[int, Island] = {}
+        self._edits = 0
+        for island in self.islands:
+            self._add_clue(island)
+
+    def _add_clue(self, island: Island):
+        self._edits += 1
+        selector = self._encoder.pool.id(("clue", island.x, island.y, self._edits))
+        self._solver.append_formula(
+            [*clause, -selector] for clause in self._encoder.encode_island(self._graph, island)
+        )
+        self._selectors[island] = selector
+        self._islands[selector] = island
+
+    def set_clue(self, row: int, column: int, number: int):
+        """
+        Changes the number of the island at row and column
+        """
+        island = self._positions.get((row, column))
+        if island is None:
+            raise ValueError(f"No island at {row}, {column}, adding islands needs a new Session")
+        if number == island.number_of_bridges:
+            return
+        selector = self._selectors.pop(island)
+        del self._islands[selector]
+        self._solver.add_clause([-selector])
+        island.number_of_bridges = number
+        self._add_clue(island)
+
+    def solve(self) -> List[List[int]] | None:
+        """
+        The solution for the current clues as [row, column, row, column, bridges] entries, or None
+        """
+        start = time.perf_counter()
+        assumptions = list(self._selectors.values())
+        if self.connected:
+            model = solve_connected(
+                self._solver, self._variables, self.islands, False, assumptions=assumptions
+            )
+        else:
+            model = self._solver.get_model() if self._solver.solve(assumptions) else None
+        solution = None
+        if model is not None:
+            self._solution.select(model, self._variables)
+            solution = solution_to_list(self._solution)
+        self.last_seconds = time.perf_counter() - start
+        return solution
+
+    def conflict(self) -> List[Island]:
+        """
+        After solve returned None, islands whose numbers can not be satisfied together
+        (not necessarily the smallest such set). Empty if the puzzle has no solution with any numbers.
+        """
+        core = self._solver.get_core() or []
+        return [self._islands[selector] for selector in core if selector in self._islands]
+
+    def close(self):
+        self._solver.delete()
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
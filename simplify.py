@@ -0,0 +1,235 @@
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Variables with more occurrences than this (positive times negative) are not tried for elimination,
+# computing their resolvents costs more than the elimination saves
+MAX_ELIMINATION_PRODUCT = 64
+
+
+class Simplifier:
+    """
+    Simplifies a cnf before it goes to the solver: duplicate and tautological clauses are removed,
+    units are propagated, subsumed clauses are removed, pure literals are set and auxiliary variables
+    are eliminated by resolution (bounded variable elimination, only if the number of clauses does not grow).
+    The frozen variables (the bridges) are never eliminated or set as pure literal, so clauses over them,
+    like the connectivity cuts, can still be added to the simplified cnf, and they can be read from the model.
+    Everything that is removed for an auxiliary variable is pushed on a stack of (clause, witness literal),
+    extend goes through it backwards and sets the witness of every clause that is not satisfied,
+    which turns a model of the simplified cnf into a model of the original one.
+    """
+
+    frozen: Set[int]
+    # number of variables of the original cnf, models are extended to all of them
+    top: int
+    stats: Dict[str, int]
+    seconds: float
+
+    def __init__(self, frozen: Iterable[int]):
+        self.frozen = set(frozen)
+        self.top = 0
+        self.stats = {}
+        self.seconds = 0.0
+        self._stack: List[Tuple[List[int], int]] = []
+        self._clauses: List[List[int] | None] = []
+        self._occurrences: Dict[int, Set[int]] = {}
+        self._units: List[int] = []
+        self._assigned: Dict[int, bool] = {}
+        self._unsatisfiable = False
+        self._pure = 0
+        self._eliminated = 0
+
+    def _add(self, clause: List[int]):
+        index = len(self._clauses)
+        self._clauses.append(clause)
+        for literal in clause:
+            self._occurrences.setdefault(literal, set()).add(index)
+
+    def _remove(self, index: int) -> List[int]:
+        clause = self._clauses[index]
+        self._clauses[index] = None
+        for literal in clause:
+            self._occurrences[literal].discard(index)
+        return clause
+
+    def _occurs(self, literal: int) -> Set[int]:
+        return self._occurrences.get(literal, set())
+
+    def simplify(self, clauses: Iterable[List[int]]) -> List[List[int]]:
+        """
+        The simplified clauses, [[]] if the cnf turned out to be unsatisfiable
+        """
+        start = time.perf_counter()
+        clauses_before = 0
+        seen = set()
+        for clause in clauses:
+            clauses_before += 1
+            literals = set(clause)
+            if not literals:
+                self._unsatisfiable = True
+                continue
+            self.top = max(self.top, *map(abs, literals))
+            if any(-literal in literals for literal in literals):
+                # a tautology is always satisfied
+                continue
+            key = tuple(sorted(literals))
+            if key not in seen:
+                seen.add(key)
+                self._add(list(key))
+        variables_before = len({abs(literal) for literal in self._occurrences})
+
+        if not self._unsatisfiable:
+            self._propagate([c[0] for c in self._clauses if len(c) == 1])
+        if not self._unsatisfiable:
+            self._subsume()
+            self._eliminate_pure(range(1, self.top + 1))
+            self._eliminate_variables()
+
+        if self._unsatisfiable:
+            result = [[]]
+        else:
+            result = [clause for clause in self._clauses if clause is not None]
+            # the units of the bridges stay in the cnf, so the solver and the model know them
+            result.extend([unit] for unit in self._units)
+        self.stats = {
+            "clauses_before": clauses_before,
+            "clauses_after": len(result),
+            "variables_before": variables_before,
+            "variables_after": len({abs(literal) for clause in result for literal in clause}),
+            "units": len(self._assigned),
+            "pure_literals": self._pure,
+            "eliminated_variables": self._eliminated,
+        }
+        self.seconds = time.perf_counter() - start
+        return result
+
+    def _propagate(self, units: List[int]):
+        """
+        Sets the units and everything that follows from them, satisfied clauses are removed
+        and false literals are removed from the other clauses
+        """
+        while units and not self._unsatisfiable:
+            literal = units.pop()
+            variable = abs(literal)
+            if variable in self._assigned:
+                if self._assigned[variable] != (literal > 0):
+                    self._unsatisfiable = True
+                continue
+            self._assigned[variable] = literal > 0
+            if variable in self.frozen:
+                self._units.append(literal)
+            else:
+                self._stack.append(([literal], literal))
+            for index in list(self._occurs(literal)):
+                self._remove(index)
+            for index in list(self._occurs(-literal)):
+                clause = self._remove(index)
+                clause.remove(-literal)
+                if not clause:
+                    self._unsatisfiable = True
+                    return
+                if len(clause) == 1:
+                    units.append(clause[0])
+                else:
+                    self._add(clause)
+
+    def _subsume(self):
+        """
+        Removes every clause that contains all literals of a shorter (or equal) clause
+        """
+        order = sorted(
+            (index for index, clause in enumerate(self._clauses) if clause is not None),
+            key=lambda index: len(self._clauses[index]),
+        )
+        for index in order:
+            clause = self._clauses[index]
+            if clause is None:
+                continue
+            literals = set(clause)
+            # every clause that is subsumed contains the rarest literal of this one
+            rarest = min(clause, key=lambda literal: len(self._occurs(literal)))
+            for other in list(self._occurs(rarest)):
+                if other != index and len(self._clauses[other]) >= len(clause):
+                    if literals.issubset(self._clauses[other]):
+                        self._remove(other)
+
+    def _eliminate_pure(self, variables: Iterable[int]):
+        """
+        Sets the auxiliary variables that only occur in one polarity, their clauses are satisfied then
+        """
+        work = [variable for variable in variables if variable not in self.frozen]
+        while work:
+            variable = work.pop()
+            if variable in self.frozen or variable in self._assigned:
+                continue
+            positive, negative = self._occurs(variable), self._occurs(-variable)
+            if positive and negative or not positive and not negative:
+                continue
+            literal = variable if positive else -variable
+            self._pure += 1
+            for index in list(self._occurs(literal)):
+                clause = self._remove(index)
+                self._stack.append((clause, literal))
+                # removing the clause can make the other variables in it pure
+                work.extend(abs(other) for other in clause if abs(other) != variable)
+
+    def _eliminate_variables(self):
+        """
+        Replaces the clauses of an auxiliary variable by all their resolvents on it,
+        if there are not more resolvents than clauses
+        """
+        candidates = [
+            variable
+            for variable in range(1, self.top + 1)
+            if variable not in self.frozen and variable not in self._assigned
+        ]
+        candidates.sort(
+            key=lambda variable: len(self._occurs(variable)) * len(self._occurs(-variable))
+        )
+        for variable in candidates:
+            positive, negative = self._occurs(variable), self._occurs(-variable)
+            if not positive or not negative:
+                self._eliminate_pure([variable])
+                continue
+            if len(positive) * len(negative) > MAX_ELIMINATION_PRODUCT:
+                continue
+            resolvents = []
+            for i in positive:
+                for j in negative:
+                    literals = set(self._clauses[i])
+                    literals.discard(variable)
+                    literals.update(self._clauses[j])
+                    literals.discard(-variable)
+                    if any(-literal in literals for literal in literals):
+                        continue
+                    resolvents.append(sorted(literals))
+                    if len(resolvents) > len(positive) + len(negative):
+                        break
+                if len(resolvents) > len(positive) + len(negative):
+                    break
+            if len(resolvents) > len(positive) + len(negative):
+                continue
+            if any(not resolvent for resolvent in resolvents):
+                self._unsatisfiable = True
+                return
+            # extend goes backwards: the variable is false unless one of its positive clauses needs it
+            for index in list(positive):
+                self._stack.append((self._remove(index), variable))
+            for index in list(negative):
+                self._remove(index)
+            self._stack.append(([-variable], -variable))
+            self._eliminated += 1
+            for resolvent in resolvents:
+                self._add(resolvent)
+
+    def extend(self, model: List[int]) -> List[int]:
+        """
+        Turns a model of the simplified cnf into a model of the original cnf, with every variable up to top
+        """
+        values = bytearray(self.top + 1)
+        for literal in model:
+            if abs(literal) <= self.top:
+                values[abs(literal)] = literal > 0
+        for clause, witness in reversed(self._stack):
+            if not any(values[abs(literal)] == (literal > 0) for literal in clause):
+                values[abs(witness)] = witness > 0
+        return [variable if values[variable] else -variable for variable in range(1, self.top + 1)]
@@ -0,0 +1,88 @@
+import time
+from typing import Dict, Iterator, List
+
+import connectivity
+import deduction
+from main import SOLVERS, _stage, encode_clauses, solution_to_list, solve_connected
+from reader import read_puzzle_from_string, to_graph
+
+
+def enumerate_solutions(
+    puzzle: str,
+    limit: int | None = None,
+    card_encoding: str = "naive",
+    solver_name: str = "minisatgh",
+    connected: bool = True,
+    deduce: bool = False,
+    verbose: bool = True,
+    timings: Dict[str, float] | None = None,
+    stats: Dict | None = None,
+) -> Iterator[List[List[int]]]:
+    """
+    Yields the solutions of the puzzle as [row, column, row, column, bridges] entries, at most limit of them.
+    The puzzle is encoded once and one solver is kept for all solutions: after each solution a clause
+    that blocks exactly its bridges is added and the solver is asked again. The blocking clause only
+    contains the bridge variables, the auxiliary variables are left free, so every solution is found once.
+    The puzzle is always encoded with the undirected encoding, in the directed encoding a single bridge
+    has two models and would be counted twice. The connectivity cuts hold for every connected solution,
+    so they stay in the solver as well. With deduce, the fixed bridges are forced in every solution
+    and are added to each of them.
+    """
+    start = time.perf_counter()
+    islands, bridges = read_puzzle_from_string(puzzle)
+    start = _stage(timings, "parse", start)
+    residual_islands, residual_bridges, nodes, fixed = islands, bridges, islands, []
+    if deduce:
+        deduced = deduction.deduce(islands, bridges, connected)
+        if deduced.unsatisfiable:
+            return
+        residual_islands, residual_bridges = deduced.islands, deduced.bridges
+        nodes, fixed = deduced.nodes, deduced.fixed
+        start = _stage(timings, "deduce", start)
+    fixed_entries = [[x.x, x.y, y.x, y.y, count] for x, y, count in fixed]
+    if not residual_bridges:
+        # every bridge is fixed, so there is at most one solution
+        if not connected or not connectivity.cut_clauses([], {}, nodes, fixed):
+            yield fixed_entries
+        return
+
+    graph = to_graph(residual_islands, residual_bridges)
+    clauses, variables = encode_clauses(
+        graph, residual_bridges, "undirected", card_encoding, False, verbose, timings, stats
+    )
+    start = time.perf_counter()
+    solver = SOLVERS[solver_name](bootstrap_with=clauses)
+    start = _stage(timings, "load", start)
+    bridge_variables = sorted(variables)
+    found = 0
+    iterations = 0
+    try:
+        while limit is None or found < limit:
+            if connected:
+                step = {}
+                model = solve_connected(solver, variables, nodes, False, fixed, step)
+                iterations += step["connectivity_iterations"]
+            else:
+                model = solver.get_model() if solver.solve() else None
+            start = _stage(timings, "solve", start)
+            if model is None:
+                break
+            found += 1
+            graph.select(model, variables)
+            yield solution_to_list(graph) + fixed_entries
+            # block exactly this assignment of the bridges
+            solver.add_clause([-model[variable - 1] for variable in bridge_variables])
+            start = time.perf_counter()
+    finally:
+        if stats is not None:
+            stats["solutions"] = found
+            stats["connectivity_iterations"] = iterations
+            stats["solver"] = solver.accum_stats() or {}
+        solver.delete()
+
+
+def count_solutions(puzzle: str, limit: int | None = None, **options) -> int:
+    """
+    Number of solutions of the puzzle, stops counting at limit
+    """
+    return sum(1 for _ in enumerate_solutions(puzzle, limit, **options))
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules of the solver live in the root of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
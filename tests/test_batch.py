@@ -0,0 +1,10 @@
+from batch import SolverPool
+
+
+def test_closing_imap_stops_every_worker():
+    pool = SolverPool(2, {"encoding": "undirected"})
+    puzzles = [(f"p{i}", "1 2\n11\n") for i in range(4)]
+    records = pool.imap(puzzles)
+    assert next(records)["status"] == "solved"
+    records.close()
+    assert pool._processes == {}
@@ -0,0 +1,30 @@
+from cache import SolutionCache, canonical_form
+
+
+def test_short_rows_are_padded_with_water():
+    assert canonical_form("2 3\n1\n..1\n")[0] == canonical_form("2 3\n1..\n..1\n")[0]
+    assert canonical_form("2 3\n1\n1..\n")[0] != canonical_form("2 3\n1.1\n1..\n")[0]
+
+
+def _sizes(cache):
+    return cache.connection.execute("SELECT COALESCE(SUM(size), 0) FROM solutions").fetchone()[0]
+
+
+def test_bytes_counter_follows_puts_and_evictions(tmp_path):
+    cache = SolutionCache(tmp_path, max_bytes=100)
+    for columns in range(1, 20):
+        cache.put(f"1 {columns + 1}\n1{'.' * (columns - 1)}1\n", [[0, 0, 0, columns, 1]])
+        assert cache.stats()["bytes"] == _sizes(cache) <= 100
+    cache.put("1 2\n11\n", None)
+    cache.put("1 2\n11\n", [[0, 0, 0, 1, 1]])
+    assert cache.stats()["bytes"] == _sizes(cache)
+
+
+def test_caches_of_older_versions_are_emptied(tmp_path):
+    cache = SolutionCache(tmp_path)
+    cache.put("1 3\n3.1\n", [[0, 0, 0, 2, 1]])
+    cache.connection.execute("PRAGMA user_version = 1")
+    cache.connection.close()
+    cache = SolutionCache(tmp_path)
+    assert cache.get("1 3\n3.1\n") == (False, None)
+    assert cache.stats()["bytes"] == 0
@@ -0,0 +1,31 @@
+import itertools
+
+import pytest
+
+from main import solve
+
+# The 3 can get at most 2 bridges from its only neighbour
+OVER_CAPACITY = "1 3\n3.1\n"
+
+ENCODINGS = ["tseytin", "arena", "direct", "undirected"]
+
+
+@pytest.mark.parametrize(
+    "encoding, polarity, deduce, simplify",
+    list(itertools.product(ENCODINGS, [False, True], [False, True], [False, True])),
+)
+def test_over_capacity_clue_is_unsatisfiable(encoding, polarity, deduce, simplify):
+    graph = solve(
+        OVER_CAPACITY,
+        encoding=encoding,
+        polarity=polarity,
+        deduce=deduce,
+        simplify=simplify,
+        verbose=False,
+    )
+    assert graph is None
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_island_without_neighbours_is_unsatisfiable(encoding):
+    assert solve("1 1\n2\n", encoding=encoding, verbose=False) is None
@@ -0,0 +1,17 @@
+import pytest
+
+from main import solve
+from portfolio import DEFAULT_PORTFOLIO
+
+# The 3 can get at most 2 bridges from its only neighbour
+OVER_CAPACITY = "1 3\n3.1\n"
+
+
+@pytest.mark.parametrize("config", DEFAULT_PORTFOLIO, ids=lambda config: ":".join(config))
+def test_every_member_finds_no_solution(config):
+    # whichever member finishes first answers for the portfolio, so each of them has to agree
+    assert solve(OVER_CAPACITY, portfolio=[config], verbose=False) is None
+
+
+def test_portfolio_finds_no_solution():
+    assert solve(OVER_CAPACITY, portfolio=DEFAULT_PORTFOLIO, verbose=False) is None
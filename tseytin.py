@@ -1,4 +1,7 @@
-from boolean import AndNode, Literal, NotNode, OrNode
+from array import array
+from typing import Callable, List, Sequence, Tuple
+
+from boolean import AND, LITERAL, NOT, OR, AndNode, Arena, Literal, NotNode, OrNode
 
 
 class CNF:
@@ -23,12 +26,222 @@ class CNF:
             self.clauses = new_node
 
 
+def _polarity_transform(
+    root,
+    opcode_of: Callable[[object], int],
+    operands_of: Callable[[object], Sequence],
+    name_of: Callable[[object], str],
+) -> Tuple[List[List[int]], List[str], int]:
+    """
+    Plaisted-Greenbaum transformation with structural sharing. Works on both the node objects and
+    the arena, the callables tell the opcode, the operands and the literal name of a node.
+    - a negation is the negated literal of its operand and never gets an auxiliary variable
+    - nested and/or nodes of the same kind are flattened into one n-ary node
+    - and/or nodes over the same literals share one auxiliary variable
+    - only the implication needed for the polarity of a node is emitted,
+      e.g. a positive And only needs "aux -> operand" and not "all operands -> aux"
+    - the conjuncts of the root are added as clauses directly, without auxiliary variables
+    Returns the clauses over integer variables, the name of each variable (index = variable - 1)
+    and the number of auxiliary variables.
+    """
+    names = []
+    variables = {}
+    # (opcode, literals of the operands) -> auxiliary variable
+    shared = {}
+    # (auxiliary variable, polarity) whose implication was already added
+    emitted = set()
+    clauses = []
+    counter = 0
+
+    def variable(name: str) -> int:
+        number = variables.get(name)
+        if number is None:
+            names.append(name)
+            number = len(names)
+            variables[name] = number
+        return number
+
+    def flatten(node, opcode: int) -> list:
+        operands = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if opcode_of(current) == opcode:
+                stack.extend(reversed(operands_of(current)))
+            else:
+                operands.append(current)
+        return operands
+
+    def literal_of(start, start_polarity: int) -> int:
+        nonlocal counter
+        # operands is None as long as the operands of the node were not visited yet
+        stack = [(start, start_polarity, None)]
+        results = []
+        while stack:
+            node, polarity, operands = stack.pop()
+            opcode = opcode_of(node)
+            if opcode == LITERAL:
+                results.append(variable(name_of(node)))
+            elif opcode == NOT:
+                if operands is None:
+                    stack.append((node, polarity, ()))
+                    stack.append((operands_of(node)[0], -polarity, None))
+                else:
+                    results.append(-results.pop())
+            elif opcode != AND and opcode != OR:
+                # if for some reason we encounter an unknown node type, we raise an error
+                # but this should never happen
+                raise ValueError(f"Unknown opcode, {opcode}")
+            elif operands is None:
+                operands = flatten(node, opcode)
+                stack.append((node, polarity, operands))
+                stack.extend((operand, polarity, None) for operand in reversed(operands))
+            else:
+                literals = sorted(set(results[len(results) - len(operands) :]))
+                del results[len(results) - len(operands) :]
+                if len(literals) == 1:
+                    results.append(literals[0])
+                    continue
+                key = (opcode, tuple(literals))
+                aux = shared.get(key)
+                if aux is None:
+                    counter += 1
+                    aux = variable(f"P_{counter}")
+                    shared[key] = aux
+                if (aux, polarity) not in emitted:
+                    emitted.add((aux, polarity))
+                    if opcode == AND and polarity > 0:
+                        clauses.extend([-aux, literal] for literal in literals)
+                    elif opcode == AND:
+                        clauses.append([aux] + [-literal for literal in literals])
+                    elif polarity > 0:
+                        clauses.append([-aux] + literals)
+                    else:
+                        clauses.extend([aux, -literal] for literal in literals)
+                results.append(aux)
+        return results.pop()
+
+    for conjunct in flatten(root, AND):
+        if opcode_of(conjunct) == OR:
+            literals = {literal_of(operand, 1) for operand in flatten(conjunct, OR)}
+            clauses.append(sorted(literals))
+        else:
+            clauses.append([literal_of(conjunct, 1)])
+    return clauses, names, counter
+
+
+def _opcode(node: Literal | AndNode | OrNode | NotNode) -> int:
+    if isinstance(node, Literal):
+        return LITERAL
+    if isinstance(node, NotNode):
+        return NOT
+    if isinstance(node, AndNode):
+        return AND
+    if isinstance(node, OrNode):
+        return OR
+    raise ValueError(f"Unknown node type, {node}")
+
+
+def _operands(node: AndNode | OrNode | NotNode) -> Tuple:
+    if isinstance(node, NotNode):
+        return (node.operand,)
+    return node.left, node.right
+
+
+def _polarity_transform_nodes(root: Literal | AndNode | OrNode | NotNode) -> AndNode:
+    clauses, names, counter = _polarity_transform(
+        root, _opcode, _operands, lambda node: node.name
+    )
+    cnf = CNF()
+    cnf.counter = counter
+    literals = [Literal(name) for name in names]
+    for clause in clauses:
+        nodes = [literals[l - 1] if l > 0 else NotNode(literals[-l - 1]) for l in clause]
+        result = nodes[0]
+        for node in nodes[1:]:
+            result = OrNode(result, node)
+        cnf.add_and_clause(result)
+    return cnf.clauses
+
+
+def _polarity_transform_arena(arena: Arena) -> Arena:
+    clauses, names, _ = _polarity_transform(
+        arena.root, arena.opcodes.__getitem__, arena.operands, arena.name
+    )
+    cnf = Arena()
+    literals = [cnf.literal(name) for name in names]
+    cnf.root = cnf.and_(
+        array(
+            "i",
+            (
+                cnf.or_(
+                    [literals[l - 1] if l > 0 else cnf.not_(literals[-l - 1]) for l in clause]
+                )
+                for clause in clauses
+            ),
+        )
+    )
+    return cnf
+
+
+def _transform_arena(arena: Arena) -> Arena:
+    """
+    Tseytin transformation of an arena into a new arena, holding an And of Or clauses.
+    Operands always have smaller ids than their node, so walking the ids in order visits every
+    operand before the nodes using it and neither recursion nor a stack is needed.
+    """
+    cnf = Arena()
+    counter = 0
+    # literal in the cnf arena that stands for each node of the expression
+    result = array("i", bytes(4 * len(arena)))
+    clauses = array("i")
+    opcodes = arena.opcodes
+    for node in range(len(arena)):
+        opcode = opcodes[node]
+        if opcode == LITERAL:
+            result[node] = cnf.literal(arena.name(node))
+            continue
+        counter += 1
+        aux = cnf.literal(f"P_{counter}")
+        not_aux = cnf.not_(aux)
+        operands = [result[operand] for operand in arena.operands(node)]
+        if opcode == NOT:
+            child = operands[0]
+            clauses.append(cnf.or_([aux, child]))
+            clauses.append(cnf.or_([not_aux, cnf.not_(child)]))
+        elif opcode == AND:
+            # aux -> every operand, all operands -> aux
+            clauses.extend(cnf.or_([not_aux, operand]) for operand in operands)
+            clauses.append(cnf.or_([aux] + [cnf.not_(operand) for operand in operands]))
+        elif opcode == OR:
+            # every operand -> aux, aux -> one of the operands
+            clauses.extend(cnf.or_([aux, cnf.not_(operand)]) for operand in operands)
+            clauses.append(cnf.or_([not_aux] + operands))
+        else:
+            # if for some reason we encounter an unknown node type, we raise an error
+            # but this should never happen
+            raise ValueError(f"Unknown opcode, {opcode}")
+        result[node] = aux
+    clauses.append(result[arena.root])
+    cnf.root = cnf.and_(clauses)
+    return cnf
+
+
 def transform(
-    node: Literal | AndNode | OrNode | NotNode, recursive: bool = False
-) -> AndNode | None:
+    node: Literal | AndNode | OrNode | NotNode | Arena,
+    recursive: bool = False,
+    polarity: bool = False,
+) -> AndNode | Arena | None:
     """
-    Transforms a boolean expression into CNF using Tseytin transformation
+    Transforms a boolean expression into CNF using Tseytin transformation,
+    or the polarity-aware Plaisted-Greenbaum transformation if polarity is set
     """
+    if polarity:
+        if isinstance(node, Arena):
+            return _polarity_transform_arena(node)
+        return _polarity_transform_nodes(node)
+    if isinstance(node, Arena):
+        return _transform_arena(node)
     cnf = CNF()
 
     def _tseytin_transform_recursive(